@@ -1,13 +1,19 @@
 import streamlit as st
-import pandas as pd
 import os
 import base64
 from tmdb_api import get_trending_movies, search_movies, get_movie_details, get_similar_movies
-from recommendation_engine import get_recommendations
+from recommendation_engine import get_recommendations, filter_movies
 from movie_data import get_all_genres, get_languages
-from quiz import display_quiz, process_quiz_results, get_or_create_user, ensure_session_id
-from utils import display_movie_card, display_movie_details, add_custom_css
+from quiz import (display_quiz, process_quiz_results, get_or_create_user, ensure_session_id,
+                  store_recommendations, clear_recommendations, get_session_recommendations,
+                  prefetch_recommendations, show_more_recommendations)
+from utils import display_movie_grid, display_movie_details, add_custom_css
 import database as db
+import write_queue
+import catalog
+import feed
+import profiler
+from migrations import run_migrations
 from login import authenticate
 
 # Page configuration
@@ -18,12 +24,22 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
+# Start a fresh set of per-rerun database query stats and, if enabled, a timing profile
+db.start_query_stats_rerun()
+profiler.start_rerun()
+
 # Add custom CSS for Netflix-inspired styling
 add_custom_css()
 
-# Initialize genre mappings in the database
-from movie_data import FALLBACK_GENRES
-db.initialize_genre_mappings(FALLBACK_GENRES)
+# Apply pending schema migrations and start the maintenance jobs once per server process
+@st.cache_resource
+def setup_database():
+    applied = run_migrations()
+    db.start_watch_compactor()
+    db.start_token_reaper()
+    return applied
+
+setup_database()
 
 # Netflix-like intro sound function
 def get_netflix_intro_sound():
@@ -36,10 +52,16 @@ if 'preferences' not in st.session_state:
     st.session_state.preferences = {}
 if 'quiz_completed' not in st.session_state:
     st.session_state.quiz_completed = False
-if 'movies_data' not in st.session_state:
-    st.session_state.movies_data = []
+if 'recommended_ids' not in st.session_state:
+    clear_recommendations()
 if 'played_intro' not in st.session_state:
     st.session_state.played_intro = False
+if 'history_pages' not in st.session_state:
+    # Pages of each History list loaded so far via "Load more"
+    st.session_state.history_pages = {'ratings': 1, 'watched': 1}
+if 'tab_data' not in st.session_state:
+    # Home tab loader results, filled when each tab is first opened
+    st.session_state.tab_data = {}
     
 # Play Netflix-like intro sound on first load
 if not st.session_state.played_intro:
@@ -47,19 +69,21 @@ if not st.session_state.played_intro:
     st.session_state.played_intro = True
     
 # Handle navigation based on query parameters
-query_params =  st.experimental_get_query_params()
+query_params = st.query_params
 current_view = "home"
 selected_movie = None
 
 if "view" in query_params:
-    current_view = query_params["view"][0]
+    current_view = query_params["view"]
     
 if "movie_id" in query_params and current_view == "details":
     try:
-        selected_movie = int(query_params["movie_id"][0])
+        selected_movie = int(query_params["movie_id"])
     except (ValueError, TypeError):
         selected_movie = None
 
+profiler.annotate(view=current_view, movie_id=selected_movie)
+
 # Check if user is authenticated
 is_authenticated = authenticate()
 
@@ -69,7 +93,7 @@ if not is_authenticated:
 
 # Ensure user session is created
 session_id = ensure_session_id()
-user_id = st.session_state.user_id if st.session_state.is_authenticated else get_or_create_user()
+user_id = get_or_create_user()
 
 # Load preferences from database if available but not in session state
 if user_id and not st.session_state.quiz_completed:
@@ -78,8 +102,9 @@ if user_id and not st.session_state.quiz_completed:
         st.session_state.preferences = saved_preferences
         st.session_state.quiz_completed = True
         # Generate recommendations based on saved preferences
-        recommendations = get_recommendations(saved_preferences)
-        st.session_state.movies_data = recommendations
+        recommendations, scores = get_recommendations(saved_preferences, db.get_session_seen_movie_ids(user_id),
+                                                      with_scores=True)
+        store_recommendations(recommendations, scores)
 
 # Header
 st.title("ChalChitra")
@@ -109,18 +134,11 @@ with st.sidebar:
         if st.button("Reset Preferences"):
             if user_id:
                 # Clear preferences in database
-                db.execute_query(
-                    "DELETE FROM user_preferences WHERE user_id = :user_id",
-                    {"user_id": user_id}
-                )
-                db.execute_query(
-                    "DELETE FROM user_genre_preferences WHERE user_id = :user_id",
-                    {"user_id": user_id}
-                )
+                db.clear_user_preferences(user_id)
                 
             st.session_state.preferences = {}
             st.session_state.quiz_completed = False
-            st.session_state.movies_data = []
+            clear_recommendations()
             st.session_state.current_view = "home"
             st.rerun()
     
@@ -152,7 +170,195 @@ def set_query_params(view, movie_id=None):
     params = {"view": view}
     if movie_id is not None:
         params["movie_id"] = str(movie_id)
-    st.experimental_set_query_params(**params)
+    st.query_params.from_dict(params)
+
+def load_history(fetch_page, user_id, pages):
+    """Fetch the first `pages` keyset pages of a history list and the cursor after them"""
+    rows = []
+    cursor = None
+    for _ in range(pages):
+        page, cursor = fetch_page(user_id, after=cursor)
+        rows.extend(page)
+        if cursor is None:
+            break
+    return rows, cursor
+
+def load_history_tab(user_id, ratings_pages, watched_pages):
+    """Load everything the History tab shows"""
+    # Write this user's queued views and ratings so they show up
+    write_queue.flush_pending(user_id)
+    
+    return (
+        # The user's rated and watched movies, as many pages as have been loaded
+        load_history(db.get_user_movie_ratings_page, user_id, ratings_pages),
+        load_history(db.get_user_watched_movies_page, user_id, watched_pages),
+        db.get_popular_movies_from_db(),
+        db.get_trending_movies_from_db()
+    )
+
+def load_movie_ids(fetch, *args):
+    """Fetch a movie list, keeping only its tmdb_ids; the movies go to the shared catalog"""
+    return catalog.remember_movies(fetch(*args))
+
+def load_tab_data(name, loader, *args):
+    """
+    Run a tab's loader when the tab is first opened and reuse the result for the session
+    
+    The tab reloads when the loader's arguments change or after this session
+    writes (a view or rating), so its own activity always shows up.
+    """
+    key = (args, st.session_state.get('db_last_write_at'))
+    cached = st.session_state.tab_data.get(name)
+    if cached is None or cached[0] != key:
+        cached = st.session_state.tab_data[name] = (key, loader(*args))
+    return cached[1]
+
+# Movie grids and the History panel are fragments: a click inside one reruns
+# only that fragment instead of the whole page pipeline above
+@st.fragment
+@profiler.fragment("app.movie_grid")
+def movie_grid(movies, key_prefix, caption_extra=None, record_view=True):
+    """
+    Show movies as a grid of clickable posters
+    
+    A click reruns just the grid to record the view, then navigates to the
+    details page with a single full rerun. `caption_extra` optionally adds
+    a line to each caption.
+    """
+    movie = display_movie_grid(movies, f"{key_prefix}_grid", caption_extra)
+    if movie:
+        if record_view:
+            # Mark movie as watched when viewing details
+            user_id = get_or_create_user()
+            if user_id:
+                write_queue.record_watched(user_id, movie)
+        
+        # Set query params and rerun
+        set_query_params("details", movie['id'])
+        st.rerun()
+
+@st.fragment
+@profiler.fragment("app.history_panel")
+def history_panel(user_id):
+    """Show the user's ratings, watch history and what is popular with other users"""
+    try:
+        (user_ratings, ratings_cursor), (watched_movies, watched_cursor), \
+            db_popular_movies, db_trending_movies = load_tab_data(
+                "history", load_history_tab, user_id,
+                st.session_state.history_pages['ratings'], st.session_state.history_pages['watched']
+            )
+        
+        # Combine information from both sources - watched and rated
+        if user_ratings:
+            st.subheader("Movies You've Rated")
+            
+            try:
+                # pandas is only needed here and in the debug panel, so it isn't loaded at startup
+                import pandas as pd
+                
+                # Convert to DataFrame for easier display
+                ratings_df = pd.DataFrame(user_ratings, columns=[
+                    'tmdb_id', 'title', 'poster_path', 'release_date', 'vote_average', 'your_rating'
+                ])
+                
+                # Display user ratings as a table
+                st.dataframe(
+                    ratings_df[['title', 'release_date', 'vote_average', 'your_rating']],
+                    column_config={
+                        "title": "Movie Title",
+                        "release_date": st.column_config.DateColumn("Release Date"),
+                        "vote_average": st.column_config.NumberColumn("TMDB Rating", format="%.1f ⭐"),
+                        "your_rating": st.column_config.NumberColumn("Your Rating", format="%d ⭐"),
+                    },
+                    use_container_width=True,
+                    hide_index=True
+                )
+            except Exception as e:
+                st.warning(f"Unable to display ratings table: {str(e)}")
+            
+            if ratings_cursor and st.button("Load more ratings", key="more_ratings"):
+                st.session_state.history_pages['ratings'] += 1
+                st.rerun(scope="fragment")
+            
+            # Display rated movies as cards
+            st.subheader("Your Rated Movies")
+            rated_movies = [
+                {
+                    'id': rating[0],  # tmdb_id
+                    'title': rating[1],
+                    'poster_path': rating[2],
+                    'release_date': rating[3],
+                    'vote_average': rating[4],
+                    'user_rating': rating[5]
+                }
+                for rating in user_ratings
+            ]
+            movie_grid(rated_movies[:8], "rated", lambda movie: f"Your rating: {movie['user_rating']}/10",
+                       record_view=False)
+        
+        # Display watched movies
+        if watched_movies:
+            st.subheader("Your Watch History")
+            watched_movie_list = [
+                {
+                    'id': movie_data[0],  # tmdb_id
+                    'title': movie_data[1],
+                    'poster_path': movie_data[2],
+                    'release_date': movie_data[3],
+                    'vote_average': movie_data[4],
+                    'view_count': movie_data[5]
+                }
+                for movie_data in watched_movies
+            ]
+            movie_grid(watched_movie_list, "watched", lambda movie: f"Viewed {movie['view_count']}×",
+                       record_view=False)
+            
+            if watched_cursor and st.button("Load more", key="more_watched"):
+                st.session_state.history_pages['watched'] += 1
+                st.rerun(scope="fragment")
+        
+        # Movies that are popular with users
+        if db_popular_movies:
+            st.subheader("Popular Among Users")
+            popular_movies = [
+                {
+                    'id': movie_data[0],  # tmdb_id
+                    'title': movie_data[1],
+                    'poster_path': movie_data[2],
+                    'release_date': movie_data[3],
+                    'vote_average': movie_data[4],
+                    'rating_count': movie_data[5],
+                    'avg_rating': movie_data[6]
+                }
+                for movie_data in db_popular_movies
+            ]
+            movie_grid(popular_movies[:4], "popular",
+                       lambda movie: f"User Rating: {movie['avg_rating']:.1f} ({movie['rating_count']} ratings)",
+                       record_view=False)
+        
+        # The movies users viewed most this week
+        if db_trending_movies:
+            st.subheader("Trending Among Users")
+            trending_movies = [
+                {
+                    'id': movie_data[0],  # tmdb_id
+                    'title': movie_data[1],
+                    'poster_path': movie_data[2],
+                    'release_date': movie_data[3],
+                    'vote_average': movie_data[4],
+                    'views': movie_data[5]
+                }
+                for movie_data in db_trending_movies
+            ]
+            movie_grid(trending_movies[:4], "trending", lambda movie: f"{movie['views']} views this week",
+                       record_view=False)
+        
+        if not user_ratings and not watched_movies and not db_popular_movies:
+            st.info("You haven't watched or rated any movies yet. Watch movies to see them appear here!")
+    
+    except Exception as e:
+        st.error(f"Error retrieving user history: {str(e)}")
+        st.info("Try exploring some movies and rating them to build your history!")
 
 # Main content area
 if current_view == "home":
@@ -160,272 +366,79 @@ if current_view == "home":
         # Display quiz
         display_quiz()
     else:
-        # Tabs for different movie categories
-        tab1, tab2, tab3, tab4 = st.tabs(["Recommended For You", "Trending", "Similar Movies", "Your History"])
+        # Tabs for different movie categories. They track the selected tab, so
+        # only the open one runs its loaders; switching tabs reruns the page.
+        tab1, tab2, tab3, tab4 = st.tabs(["Recommended For You", "Trending", "Similar Movies", "Your History"],
+                                         key="home_tab", on_change="rerun")
         
         with tab1:
-            st.header("Recommended For You")
-            
-            # Apply filters to recommendations
-            filtered_movies = st.session_state.movies_data
-            
-            if search_query:
-                search_results = search_movies(search_query)
-                st.write(f"Search results for '{search_query}'")
-                if search_results:
-                    cols = st.columns(4)
-                    for idx, movie in enumerate(search_results[:8]):
-                        with cols[idx % 4]:
-                            # Add URL to movie card for details
-                            if st.button(f"View: {movie['title'][:20]}...", key=f"search_{movie['id']}"):
-                                # Mark movie as watched when viewing details
-                                user_id = get_or_create_user()
-                                if user_id:
-                                    db.save_watched_movie(user_id, movie)
-                                
-                                # Set query params and rerun
-                                set_query_params("details", movie['id'])
-                                st.rerun()
-                            
-                            # Display movie card
-                            st.image(movie.get('poster_path', "https://via.placeholder.com/200x300?text=No+Image"), 
-                                    width=150, 
-                                    caption=f"{movie.get('title')} ({movie.get('release_date', '')[:4]})\n★ {movie.get('vote_average', 0):.1f}")
-                else:
-                    st.write("No results found.")
-            else:
-                # Apply genre filter if selected
-                if selected_genre != "All Genres":
-                    filtered_movies = [m for m in filtered_movies if selected_genre in m.get('genres', [])]
+            if tab1.open:
+                st.header("Recommended For You")
                 
-                # Apply language filter if selected
-                if selected_language != "All Languages":
-                    # Extract language code from display format (e.g., "English (en)" -> "en")
-                    language_code = selected_language.split("(")[-1].replace(")", "").strip() if "(" in selected_language else selected_language
-                    filtered_movies = [m for m in filtered_movies if m.get('original_language') == language_code]
+                # Apply filters to recommendations
+                filtered_movies = get_session_recommendations()
                 
-                if filtered_movies:
-                    # Display movies in a grid layout
-                    cols = st.columns(4)
-                    for idx, movie in enumerate(filtered_movies[:8]):
-                        with cols[idx % 4]:
-                            # Add URL to movie card for details
-                            if st.button(f"View: {movie['title'][:20]}...", key=f"rec_{movie['id']}"):
-                                # Mark movie as watched when viewing details
-                                user_id = get_or_create_user()
-                                if user_id:
-                                    db.save_watched_movie(user_id, movie)
-                                
-                                # Set query params and rerun
-                                set_query_params("details", movie['id'])
-                                st.rerun()
-                            
-                            # Display movie card
-                            st.image(movie.get('poster_path', "https://via.placeholder.com/200x300?text=No+Image"), 
-                                    width=150, 
-                                    caption=f"{movie.get('title')} ({movie.get('release_date', '')[:4]})\n★ {movie.get('vote_average', 0):.1f}")
+                if search_query:
+                    search_results = search_movies(search_query)
+                    st.write(f"Search results for '{search_query}'")
+                    if search_results:
+                        movie_grid(search_results[:8], "search")
+                    else:
+                        st.write("No results found.")
                 else:
-                    st.write("No movies match your filters. Try adjusting your preferences.")
+                    # Apply genre and language filters if selected
+                    genre_filter = selected_genre if selected_genre != "All Genres" else None
+                    language_filter = None
+                    if selected_language != "All Languages":
+                        # Extract language code from display format (e.g., "English (en)" -> "en")
+                        language_filter = selected_language.split("(")[-1].replace(")", "").strip() if "(" in selected_language else selected_language
+                    filtered_movies = filter_movies(filtered_movies, genre_filter, language_filter)
+                    
+                    if filtered_movies:
+                        # Display the feed's pages so far in a grid layout
+                        visible = st.session_state.rec_feed['visible']
+                        movie_grid(filtered_movies[:visible], "rec")
+                        
+                        if len(filtered_movies) > visible or not st.session_state.rec_feed['exhausted']:
+                            st.button("Show more", key="more_recs", on_click=show_more_recommendations)
+                            # Rank the next page while this one is being looked at
+                            prefetch_recommendations()
+                    else:
+                        st.write("No movies match your filters. Try adjusting your preferences.")
         
         with tab2:
-            st.header("Trending Movies")
-            trending_movies = get_trending_movies()
-            
-            if trending_movies:
-                cols = st.columns(4)
-                for idx, movie in enumerate(trending_movies[:8]):
-                    with cols[idx % 4]:
-                        # Add URL to movie card for details
-                        if st.button(f"View: {movie['title'][:20]}...", key=f"trend_{movie['id']}"):
-                            # Mark movie as watched when viewing details
-                            user_id = get_or_create_user()
-                            if user_id:
-                                db.save_watched_movie(user_id, movie)
-                            
-                            # Set query params and rerun
-                            set_query_params("details", movie['id'])
-                            st.rerun()
-                        
-                        # Display movie card
-                        st.image(movie.get('poster_path', "https://via.placeholder.com/200x300?text=No+Image"), 
-                                width=150, 
-                                caption=f"{movie.get('title')} ({movie.get('release_date', '')[:4]})\n★ {movie.get('vote_average', 0):.1f}")
+            if tab2.open:
+                st.header("Trending Movies")
+                trending_ids = load_tab_data("trending", load_movie_ids, get_trending_movies)
+                trending_movies = catalog.resolve_movies(trending_ids[:8])
+                
+                if trending_movies:
+                    movie_grid(trending_movies[:8], "trend")
         
         with tab3:
-            st.header("You Might Also Like")
-            if st.session_state.movies_data:
-                # Show similar movies based on the first recommendation
-                similar_movies = get_similar_movies(st.session_state.movies_data[0]['id'])
-                
-                if similar_movies:
-                    cols = st.columns(4)
-                    for idx, movie in enumerate(similar_movies[:8]):
-                        with cols[idx % 4]:
-                            # Add URL to movie card for details
-                            if st.button(f"View: {movie['title'][:20]}...", key=f"sim_{movie['id']}"):
-                                # Mark movie as watched when viewing details
-                                user_id = get_or_create_user()
-                                if user_id:
-                                    db.save_watched_movie(user_id, movie)
-                                
-                                # Set query params and rerun
-                                set_query_params("details", movie['id'])
-                                st.rerun()
-                            
-                            # Display movie card
-                            st.image(movie.get('poster_path', "https://via.placeholder.com/200x300?text=No+Image"), 
-                                    width=150, 
-                                    caption=f"{movie.get('title')} ({movie.get('release_date', '')[:4]})\n★ {movie.get('vote_average', 0):.1f}")
+            if tab3.open:
+                st.header("You Might Also Like")
+                if len(st.session_state.recommended_ids):
+                    # Show similar movies based on the first recommendation
+                    similar_ids = load_tab_data("similar", load_movie_ids, get_similar_movies,
+                                                int(st.session_state.recommended_ids[0]))
+                    similar_movies = catalog.resolve_movies(similar_ids[:8])
+                    
+                    if similar_movies:
+                        movie_grid(similar_movies[:8], "sim")
+                    else:
+                        st.write("No similar movies found.")
                 else:
-                    st.write("No similar movies found.")
-            else:
-                st.write("Complete the preference quiz to get recommendations.")
+                    st.write("Complete the preference quiz to get recommendations.")
                 
         with tab4:
-            st.header("Your History")
-            
-            if user_id:
-                try:
-                    # Get user's rated movies
-                    user_ratings = db.get_user_movie_ratings(user_id)
-                    
-                    # Get user's watched movies
-                    watched_movies = db.get_user_watched_movies(user_id)
-                    
-                    # Combine information from both sources - watched and rated
-                    if user_ratings:
-                        st.subheader("Movies You've Rated")
-                        
-                        try:
-                            # Convert to DataFrame for easier display
-                            ratings_df = pd.DataFrame(user_ratings, columns=[
-                                'tmdb_id', 'title', 'poster_path', 'release_date', 'vote_average', 'your_rating'
-                            ])
-                            
-                            # Display user ratings as a table
-                            st.dataframe(
-                                ratings_df[['title', 'release_date', 'vote_average', 'your_rating']],
-                                column_config={
-                                    "title": "Movie Title",
-                                    "release_date": st.column_config.DateColumn("Release Date"),
-                                    "vote_average": st.column_config.NumberColumn("TMDB Rating", format="%.1f ⭐"),
-                                    "your_rating": st.column_config.NumberColumn("Your Rating", format="%d ⭐"),
-                                },
-                                use_container_width=True,
-                                hide_index=True
-                            )
-                        except Exception as e:
-                            st.warning(f"Unable to display ratings table: {str(e)}")
-                        
-                        # Display rated movies as cards
-                        st.subheader("Your Rated Movies")
-                        rated_movies = []
-                        for rating in user_ratings:
-                            try:
-                                movie = {
-                                    'id': rating[0],  # tmdb_id
-                                    'title': rating[1],
-                                    'poster_path': rating[2],
-                                    'release_date': rating[3],
-                                    'vote_average': rating[4],
-                                    'user_rating': rating[5]
-                                }
-                                rated_movies.append(movie)
-                            except IndexError:
-                                continue
-                        
-                        if rated_movies:
-                            cols = st.columns(4)
-                            for idx, movie in enumerate(rated_movies[:8]):
-                                with cols[idx % 4]:
-                                    # Add URL to movie card for details
-                                    if st.button(f"View: {movie['title'][:20]}...", key=f"rated_{movie['id']}"):
-                                        # Set query params and rerun
-                                        set_query_params("details", movie['id'])
-                                        st.rerun()
-                                    
-                                    # Display movie card
-                                    st.image(movie.get('poster_path', "https://via.placeholder.com/200x300?text=No+Image"), 
-                                            width=150, 
-                                            caption=f"{movie.get('title')} ({movie.get('release_date', '')[:4]})\n★ {movie.get('vote_average', 0):.1f}\nYour rating: {movie.get('user_rating')}/10")
-                    
-                    # Display watched movies
-                    if watched_movies:
-                        st.subheader("Your Watch History")
-                        
-                        watched_movie_list = []
-                        for movie_data in watched_movies:
-                            try:
-                                movie = {
-                                    'id': movie_data[0],  # tmdb_id
-                                    'title': movie_data[1],
-                                    'poster_path': movie_data[2],
-                                    'release_date': movie_data[3],
-                                    'vote_average': movie_data[4]
-                                }
-                                watched_movie_list.append(movie)
-                            except IndexError:
-                                continue
-                        
-                        if watched_movie_list:
-                            cols = st.columns(4)
-                            for idx, movie in enumerate(watched_movie_list[:8]):
-                                with cols[idx % 4]:
-                                    # Add URL to movie card for details
-                                    if st.button(f"View: {movie['title'][:20]}...", key=f"watched_{movie['id']}"):
-                                        # Set query params and rerun
-                                        set_query_params("details", movie['id'])
-                                        st.rerun()
-                                    
-                                    # Display movie card
-                                    st.image(movie.get('poster_path', "https://via.placeholder.com/200x300?text=No+Image"), 
-                                            width=150, 
-                                            caption=f"{movie.get('title')} ({movie.get('release_date', '')[:4]})\n★ {movie.get('vote_average', 0):.1f}")
-                    
-                    # Get movies from database that are popular with users
-                    db_popular_movies = db.get_popular_movies_from_db()
-                    
-                    if db_popular_movies:
-                        st.subheader("Popular Among Users")
-                        popular_movies = []
-                        for movie_data in db_popular_movies:
-                            try:
-                                movie = {
-                                    'id': movie_data[0],  # tmdb_id
-                                    'title': movie_data[1],
-                                    'poster_path': movie_data[2],
-                                    'release_date': movie_data[3],
-                                    'vote_average': movie_data[4],
-                                    'rating_count': movie_data[5],
-                                    'avg_rating': movie_data[6]
-                                }
-                                popular_movies.append(movie)
-                            except IndexError:
-                                continue
-                        
-                        if popular_movies:
-                            cols = st.columns(4)
-                            for idx, movie in enumerate(popular_movies[:4]):
-                                with cols[idx % 4]:
-                                    # Add URL to movie card for details
-                                    if st.button(f"View: {movie['title'][:20]}...", key=f"popular_{movie['id']}"):
-                                        # Set query params and rerun
-                                        set_query_params("details", movie['id'])
-                                        st.rerun()
-                                    
-                                    # Display movie card
-                                    st.image(movie.get('poster_path', "https://via.placeholder.com/200x300?text=No+Image"), 
-                                            width=150, 
-                                            caption=f"{movie.get('title')} ({movie.get('release_date', '')[:4]})\n★ {movie.get('vote_average', 0):.1f}\nUser Rating: {movie.get('avg_rating', 0):.1f} ({movie.get('rating_count', 0)} ratings)")
-                    
-                    if not user_ratings and not watched_movies and not db_popular_movies:
-                        st.info("You haven't watched or rated any movies yet. Watch movies to see them appear here!")
+            if tab4.open:
+                st.header("Your History")
                 
-                except Exception as e:
-                    st.error(f"Error retrieving user history: {str(e)}")
-                    st.info("Try exploring some movies and rating them to build your history!")
-            else:
-                st.error("Unable to retrieve user history. Please refresh the page or log in.")
+                if user_id:
+                    history_panel(user_id)
+                else:
+                    st.error("Unable to retrieve user history. Please refresh the page or log in.")
 
 elif current_view == "details":
     # Back button
@@ -444,21 +457,66 @@ elif current_view == "details":
         similar_movies = get_similar_movies(selected_movie)
         
         if similar_movies:
-            cols = st.columns(4)
-            for idx, movie in enumerate(similar_movies[:4]):
-                with cols[idx % 4]:
-                    # Add URL to movie card for details
-                    if st.button(f"View: {movie['title'][:20]}...", key=f"similar_{movie['id']}"):
-                        # Mark movie as watched when viewing details
-                        user_id = get_or_create_user()
-                        if user_id:
-                            db.save_watched_movie(user_id, movie)
-                        
-                        # Set query params and rerun
-                        set_query_params("details", movie['id'])
-                        st.rerun()
-                    
-                    # Display movie card
-                    st.image(movie.get('poster_path', "https://via.placeholder.com/200x300?text=No+Image"), 
-                            width=150, 
-                            caption=f"{movie.get('title')} ({movie.get('release_date', '')[:4]})\n★ {movie.get('vote_average', 0):.1f}")
+            movie_grid(similar_movies[:4], "similar")
+
+# Database debug panel (set CHALCHITRA_DEBUG=1 to enable)
+if os.getenv("CHALCHITRA_DEBUG"):
+    query_stats = db.get_query_stats()
+    with st.sidebar.expander("Database queries", expanded=True):
+        st.metric("Queries this rerun", query_stats["rerun"]["count"])
+        st.metric("DB time this rerun", f"{query_stats['rerun']['total_ms']:.1f} ms")
+        st.caption(f"Session: {query_stats['session']['count']} queries, "
+                   f"{query_stats['session']['total_ms']:.1f} ms over {query_stats['reruns']} reruns "
+                   f"(fragment-only reruns included)")
+        user_cache_stats = db.get_user_cache_stats()
+        st.caption(f"User cache: {user_cache_stats['hits']} hits, {user_cache_stats['misses']} misses, "
+                   f"{user_cache_stats['users']} users")
+        token_cache_stats = db.get_token_cache_stats()
+        st.caption(f"Token cache: {token_cache_stats['hits']} hits, {token_cache_stats['misses']} misses, "
+                   f"{token_cache_stats['tokens']} tokens, {token_cache_stats['reaped']} expired reaped")
+        catalog_stats = catalog.get_catalog_stats()
+        st.caption(f"Movie catalog: {catalog_stats['size']}/{catalog_stats['max_size']} movies, "
+                   f"{catalog_stats['hits']} hits, {catalog_stats['misses']} misses, "
+                   f"{catalog_stats['loaded']} reloaded, {catalog_stats['fetched']} refetched, "
+                   f"{catalog_stats['evicted']} evicted")
+        feed_stats = feed.get_feed_stats()
+        st.caption(f"Feed prefetch: {feed_stats['ready']} ready, {feed_stats['waited']} waited, "
+                   f"{feed_stats['computed']} computed on demand, {feed_stats['timed_out']} timed out, "
+                   f"{feed_stats['pending']} pending, {feed_stats['failed']} failed")
+        write_queue_stats = write_queue.get_write_queue_stats()
+        st.caption(f"Write queue: {write_queue_stats['depth']} pending, {write_queue_stats['flushed']} written, "
+                   f"last flush {write_queue_stats['last_flush_ms']:.1f} ms, "
+                   f"max {write_queue_stats['max_flush_ms']:.1f} ms, {write_queue_stats['retrying']} retrying, "
+                   f"{write_queue_stats['dead_lettered']} dead-lettered")
+        replica_status = db.get_replica_status()
+        if replica_status["replicas"]:
+            st.caption(f"Replicas: {replica_status['healthy']}/{replica_status['replicas']} healthy, "
+                       f"reads {'pinned to primary' if replica_status['sticky'] else 'on replicas'}")
+        if query_stats["rerun"]["queries"]:
+            import pandas as pd
+            st.dataframe(pd.DataFrame(query_stats["rerun"]["queries"]), hide_index=True)
+
+# Rerun timing overlay (set CHALCHITRA_PROFILE=1 to enable, CHALCHITRA_PROFILE_LOG to also log JSON lines)
+if profiler.PROFILE_ENABLED:
+    profile = profiler.finish_rerun()
+    with st.sidebar.expander("Rerun timings", expanded=True):
+        import pandas as pd
+        st.metric("This rerun", f"{profile['ms']:.1f} ms")
+        if profile["spans"]:
+            st.dataframe(pd.DataFrame(profiler.flatten(profile)), hide_index=True)
+        if profile["timers"]:
+            st.caption("Totals by span")
+            st.dataframe(pd.DataFrame([
+                {"span": name, "count": timer["count"], "ms": timer["ms"]}
+                for name, timer in profile["timers"].items()
+            ]), hide_index=True)
+        if profile["dropped_spans"]:
+            st.caption(f"{profile['dropped_spans']} spans past the first {profiler.MAX_PROFILE_SPANS} only counted in the totals")
+        
+        recent_profiles = profiler.get_session_profiles()
+        st.caption("Recent reruns: " + ", ".join(
+            f"{recent['name']}{' (interrupted)' if recent['interrupted'] else ''} {recent['ms']:.0f} ms"
+            for recent in reversed(recent_profiles[-6:])
+        ))
+        st.download_button("Download as JSON lines", profiler.to_jsonl(recent_profiles),
+                           file_name="rerun_profiles.jsonl", mime="application/x-ndjson")
@@ -0,0 +1,195 @@
+import datetime
+import json
+import os
+
+from sqlalchemy import create_engine, event, text
+
+# Key for the advisory lock that keeps concurrent workers from migrating at once
+MIGRATION_LOCK_KEY = 7243001
+
+class PostgresBackend:
+    """Hosted Postgres, used by multi-node deployments"""
+    name = "postgresql"
+
+    # DDL fragments substituted into the schema migrations
+    schema_types = {
+        "serial_pk": "SERIAL PRIMARY KEY",
+        "text_array": "TEXT[]",
+        "int_array": "INTEGER[]"
+    }
+
+    # Appended to a SELECT that is followed by a write to the same row
+    row_lock = " FOR UPDATE"
+
+    def create_engine(self, url, **pool_options):
+        """Create the SQLAlchemy engine for a postgresql:// URL"""
+        return create_engine(
+            url,
+            connect_args={
+                "sslmode": os.getenv("DB_SSLMODE", "require"),
+                "keepalives": 1,
+                "keepalives_idle": 30
+            },
+            **pool_options
+        )
+
+    def encode_array(self, values):
+        """Convert a Python list to a PostgreSQL array literal"""
+        if values is None:
+            return None
+        return "{" + ",".join(map(str, values)) + "}"
+
+    def decode_array(self, value):
+        """Convert an array column value to a Python list"""
+        return list(value) if value is not None else None
+
+    def explain(self, cursor, statement, parameters):
+        """Get the query plan of a statement as text"""
+        cursor.execute("EXPLAIN " + statement, parameters)
+        return "\n".join(row[0] for row in cursor.fetchall())
+
+    def lock(self, conn, key):
+        """Take an advisory lock held until the transaction ends"""
+        conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": key})
+
+    def lock_migrations(self, conn):
+        """Serialize migration runs across workers until the transaction ends"""
+        self.lock(conn, MIGRATION_LOCK_KEY)
+
+    def day(self, column):
+        """SQL expression for the calendar day of a timestamp column"""
+        return f"CAST({column} AS DATE)"
+
+    def partition_by_month(self, column):
+        """Clause that makes a new table range-partitioned on a timestamp column"""
+        return f" PARTITION BY RANGE ({column})"
+
+    def create_month_partitions(self, conn, table, months):
+        """Create the default partition and one partition for each month start in `months`"""
+        conn.execute(text(f"CREATE TABLE IF NOT EXISTS {table}_default PARTITION OF {table} DEFAULT"))
+        for month in months:
+            next_month = (month.replace(day=28) + datetime.timedelta(days=4)).replace(day=1)
+            conn.execute(text(
+                f"CREATE TABLE IF NOT EXISTS {table}_{month:%Y_%m} PARTITION OF {table} "
+                f"FOR VALUES FROM ('{month:%Y-%m-%d}') TO ('{next_month:%Y-%m-%d}')"
+            ))
+
+    def drop_month_partitions(self, conn, table, column, before):
+        """Drop the monthly partitions, and default-partition rows, older than a month start"""
+        partitions = conn.execute(text("""
+            SELECT child.relname
+            FROM pg_inherits i
+            JOIN pg_class child ON i.inhrelid = child.oid
+            JOIN pg_class parent ON i.inhparent = parent.oid
+            WHERE parent.relname = :table
+        """), {"table": table}).fetchall()
+
+        for (name,) in partitions:
+            try:
+                month = datetime.datetime.strptime(name[len(table) + 1:], "%Y_%m").date()
+            except ValueError:
+                continue
+            if month < before:
+                conn.execute(text(f"DROP TABLE {name}"))
+
+        conn.execute(text(f"DELETE FROM {table}_default WHERE {column} < :before"), {"before": before})
+
+class SqliteBackend:
+    """Embedded SQLite in WAL mode, for single-node and offline deployments"""
+    name = "sqlite"
+
+    schema_types = {
+        "serial_pk": "INTEGER PRIMARY KEY AUTOINCREMENT",
+        # Arrays are stored as JSON text
+        "text_array": "TEXT",
+        "int_array": "TEXT"
+    }
+
+    # SQLite locks the whole database for writes, so no row locks are needed
+    row_lock = ""
+
+    def create_engine(self, url, **pool_options):
+        """Create the SQLAlchemy engine for a sqlite:// URL"""
+        engine = create_engine(
+            url,
+            # Pooled connections are shared between Streamlit's script threads
+            connect_args={"check_same_thread": False},
+            **pool_options
+        )
+
+        @event.listens_for(engine, "connect")
+        def _configure_connection(dbapi_connection, connection_record):
+            # Let SQLAlchemy, not the sqlite3 module, decide when transactions begin
+            dbapi_connection.isolation_level = None
+            cursor = dbapi_connection.cursor()
+            # WAL lets readers run while a write is in progress
+            cursor.execute("PRAGMA journal_mode=WAL")
+            cursor.execute("PRAGMA synchronous=NORMAL")
+            cursor.execute("PRAGMA foreign_keys=ON")
+            cursor.execute("PRAGMA busy_timeout=5000")
+            cursor.close()
+
+        @event.listens_for(engine, "begin")
+        def _begin_transaction(conn):
+            # IMMEDIATE takes the write lock up front, so a read-then-write
+            # transaction waits on busy_timeout instead of failing to upgrade.
+            # Read-only connections (streamed exports) take a plain snapshot
+            # so they don't block writers for their whole run.
+            # Sent on the driver connection so it stays out of the query stats.
+            if conn.get_execution_options().get("read_only"):
+                conn.connection.driver_connection.execute("BEGIN")
+            else:
+                conn.connection.driver_connection.execute("BEGIN IMMEDIATE")
+
+        return engine
+
+    def encode_array(self, values):
+        """Convert a Python list to JSON text"""
+        if values is None:
+            return None
+        return json.dumps(list(values))
+
+    def decode_array(self, value):
+        """Convert JSON text back to a Python list"""
+        return json.loads(value) if value is not None else None
+
+    def explain(self, cursor, statement, parameters):
+        """Get the query plan of a statement as text"""
+        cursor.execute("EXPLAIN QUERY PLAN " + statement, parameters)
+        return "\n".join(str(row[-1]) for row in cursor.fetchall())
+
+    def lock(self, conn, key):
+        """SQLite already serializes writers on the database file"""
+        pass
+
+    def lock_migrations(self, conn):
+        """SQLite already serializes writers on the database file"""
+        pass
+
+    def day(self, column):
+        """SQL expression for the calendar day of a timestamp column"""
+        return f"DATE({column})"
+
+    def partition_by_month(self, column):
+        """SQLite has no partitioning; the table is pruned with DELETE instead"""
+        return ""
+
+    def create_month_partitions(self, conn, table, months):
+        """Nothing to create; see partition_by_month"""
+        pass
+
+    def drop_month_partitions(self, conn, table, column, before):
+        """Delete the rows older than a month start"""
+        conn.execute(text(f"DELETE FROM {table} WHERE {column} < :before"), {"before": before.isoformat()})
+
+BACKENDS = {
+    "postgresql": PostgresBackend,
+    "sqlite": SqliteBackend
+}
+
+def get_backend(database_url):
+    """Pick the backend for a database URL by its scheme"""
+    scheme = database_url.split(":", 1)[0].split("+", 1)[0]
+    if scheme not in BACKENDS:
+        raise ValueError(f"Unsupported database URL scheme: {scheme}")
+    return BACKENDS[scheme]()
@@ -0,0 +1,395 @@
+"""
+Benchmarks for the ranking and filtering hot paths, and for app startup
+
+Usage:
+    python benchmark.py run                      # time every case and print the results
+    python benchmark.py run --save               # ...and store them as the JSON baseline
+    python benchmark.py compare                  # fail if any case is slower than the baseline
+    python benchmark.py run --sizes 100,1000     # restrict the candidate pool sizes
+    python benchmark.py imports                  # import time of the app's modules per package
+    python benchmark.py startup                  # cold start to first render, against the baseline
+    python benchmark.py startup --save           # ...and store it in the JSON baseline
+    python benchmark.py memory --sessions 2000   # session memory: movie dicts vs. catalog ids
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+DEFAULT_SIZES = [100, 1000, 10000, 100000, 1000000]
+ROOT = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_BASELINE = os.path.join(ROOT, "benchmark_baseline.json")
+APP_PATH = os.path.join(ROOT, "app.py")
+
+# What app.py imports; profiled as modules since importing app.py runs the page
+APP_MODULES = ["tmdb_api", "recommendation_engine", "movie_data", "quiz", "utils",
+               "database", "write_queue", "migrations", "login"]
+
+# Run in a fresh interpreter: loads Streamlit, then runs app.py once as a new
+# session would, and prints the two durations as JSON
+STARTUP_SCRIPT = """
+import json, sys, time
+started = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+app_test = AppTest.from_file(sys.argv[1], default_timeout=120)
+loaded = time.perf_counter()
+app_test.run()
+rendered = time.perf_counter()
+print(json.dumps({
+    "streamlit_import": loaded - started,
+    "first_render": rendered - loaded,
+    "exceptions": [exception.message for exception in app_test.exception]
+}))
+"""
+
+# TMDB genres with a rough share of movies tagged with each
+GENRES = {
+    18: ("Drama", 30), 35: ("Comedy", 20), 53: ("Thriller", 12), 28: ("Action", 11),
+    10749: ("Romance", 10), 27: ("Horror", 9), 80: ("Crime", 8), 99: ("Documentary", 8),
+    12: ("Adventure", 7), 878: ("Science Fiction", 5), 9648: ("Mystery", 5), 14: ("Fantasy", 5),
+    10751: ("Family", 5), 16: ("Animation", 4), 36: ("History", 3), 10402: ("Music", 3),
+    10770: ("TV Movie", 3), 10752: ("War", 2), 37: ("Western", 1)
+}
+
+LANGUAGE_WEIGHTS = {
+    "en": 60, "fr": 6, "es": 6, "ja": 5, "hi": 5, "ko": 4, "de": 4, "it": 3, "zh": 3, "ru": 2, "pt": 2
+}
+
+# Preferences as saved by the quiz
+PREFERENCES = {
+    'genres': [28, 878, 53],
+    'year_range': [2000, 2023],
+    'min_rating': 6.5,
+    'languages': ['en'],
+    'runtime_range': None
+}
+
+def generate_movies(count, seed=42):
+    """Generate a synthetic candidate pool shaped like processed TMDB results"""
+    rng = random.Random(seed)
+    genre_ids = list(GENRES)
+    genre_weights = [weight for _, weight in GENRES.values()]
+    languages = list(LANGUAGE_WEIGHTS)
+    language_weights = list(LANGUAGE_WEIGHTS.values())
+
+    movies = []
+    for movie_id in range(1, count + 1):
+        # Release years are skewed towards recent decades
+        year = int(2024 - rng.betavariate(1.2, 4.0) * 100)
+        movie_genres = list(dict.fromkeys(rng.choices(genre_ids, genre_weights, k=rng.randint(1, 3))))
+        # TMDB vote averages cluster around 6.5
+        vote_average = round(min(max(rng.gauss(6.5, 1.1), 0.0), 10.0), 1)
+
+        movies.append({
+            'id': movie_id,
+            'title': f"Movie {movie_id}",
+            'poster_path': f"https://image.tmdb.org/t/p/w500/{movie_id}.jpg",
+            'release_date': f"{year}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+            'vote_average': vote_average,
+            'overview': "A synthetic movie used for benchmarking.",
+            'genre_ids': movie_genres,
+            'genres': [GENRES[genre_id][0] for genre_id in movie_genres],
+            'original_language': rng.choices(languages, language_weights)[0]
+        })
+
+    return movies
+
+def with_duplicates(movies, ratio=0.2, seed=42):
+    """Append a shuffled share of the pool again, like discover results merged with trending"""
+    rng = random.Random(seed)
+    repeated = rng.sample(movies, int(len(movies) * ratio))
+    return movies + repeated
+
+def time_call(func, repeat):
+    """Time a zero-argument callable and return min/median seconds over `repeat` runs"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+
+    return summarize(timings)
+
+def summarize(timings):
+    """Min/median of a list of durations in seconds"""
+    return {
+        'min': min(timings),
+        'median': statistics.median(timings),
+        'repeat': len(timings)
+    }
+
+def profile_imports(modules=APP_MODULES):
+    """
+    Import modules in a fresh interpreter under -X importtime
+    
+    Returns:
+    dict: Seconds spent importing each top-level package, slowest first
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "; ".join(f"import {module}" for module in modules)],
+        capture_output=True, text=True, cwd=ROOT
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing the app modules failed:\n{result.stderr[-2000:]}")
+
+    packages = {}
+    for line in result.stderr.splitlines():
+        # import time: <self us> | <cumulative us> | <indented module name>
+        if not line.startswith("import time:"):
+            continue
+        self_us, _, name = line[len("import time:"):].split("|")
+        if not self_us.strip().isdigit():
+            continue  # the header row
+        package = name.strip().split(".")[0]
+        packages[package] = packages.get(package, 0.0) + int(self_us) / 1e6
+
+    return dict(sorted(packages.items(), key=lambda item: item[1], reverse=True))
+
+def time_startup(repeat):
+    """Time cold starts to the first rendered page, each in a fresh interpreter"""
+    timings = {"streamlit_import": [], "first_render": []}
+
+    for _ in range(repeat):
+        result = subprocess.run([sys.executable, "-c", STARTUP_SCRIPT, APP_PATH],
+                                capture_output=True, text=True, cwd=ROOT)
+        if result.returncode != 0:
+            raise RuntimeError(f"Startup run failed:\n{result.stderr[-2000:]}")
+        run = json.loads(result.stdout.strip().splitlines()[-1])
+        if run["exceptions"]:
+            raise RuntimeError(f"app.py raised during the first render: {run['exceptions'][0]}")
+
+        for name in timings:
+            timings[name].append(run[name])
+
+    return {name: summarize(values) for name, values in timings.items()}
+
+def measure_session_memory(sessions, per_session=100, pool_size=2000, seed=42):
+    """
+    Measure the memory that many sessions' recommendations hold in each layout
+    
+    Every session gets `per_session` movies drawn from a pool of popular
+    ones, as its own unpickled copy like st.cache_data returns them. The
+    "movie_dicts" layout keeps that list in session state; "catalog_ids"
+    keeps tmdb_ids and scores and puts the movies in a shared MovieCatalog.
+    
+    Returns:
+    dict: Bytes held in total and per session, per layout
+    """
+    import pickle
+    import tracemalloc
+    import numpy as np
+    from catalog import MovieCatalog
+
+    pool = generate_movies(pool_size, seed)
+    rng = random.Random(seed)
+    draws = [rng.sample(range(pool_size), per_session) for _ in range(sessions)]
+    scores = np.linspace(1.0, 0.0, per_session)
+
+    results = {}
+    for layout in ("movie_dicts", "catalog_ids"):
+        tracemalloc.start()
+        catalog = MovieCatalog(max_movies=pool_size)
+        session_states = []
+        for draw in draws:
+            movies = pickle.loads(pickle.dumps([pool[index] for index in draw]))
+            if layout == "movie_dicts":
+                session_states.append({'movies_data': movies})
+            else:
+                session_states.append({
+                    'recommended_ids': catalog.put(movies),
+                    'recommended_scores': scores.astype(np.float32)
+                })
+        held, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        del session_states, catalog
+
+        results[layout] = {'total_bytes': held, 'per_session_bytes': held / sessions}
+
+    return results
+
+def get_cases(movies):
+    """Build the benchmark cases for a candidate pool"""
+    import numpy as np
+    from recommendation_engine import rank_recommendations, filter_by_preferences, remove_duplicates, filter_movies, exclude_seen
+
+    pool_with_duplicates = with_duplicates(movies)
+    # A heavy user who has seen every tenth movie in the pool
+    seen_ids = np.arange(1, len(movies) + 1, 10, dtype=np.int64)
+
+    return {
+        'rank_recommendations': lambda: rank_recommendations(movies, PREFERENCES),
+        'trending_filter': lambda: filter_by_preferences(
+            movies, PREFERENCES['genres'], PREFERENCES['languages'], PREFERENCES['min_rating']
+        ),
+        'remove_duplicates': lambda: remove_duplicates(pool_with_duplicates),
+        'exclude_seen': lambda: exclude_seen(movies, seen_ids),
+        'sidebar_filters': lambda: filter_movies(movies, "Action", "en")
+    }
+
+def run_benchmarks(sizes, repeat):
+    """Run every case for every pool size"""
+    results = {}
+
+    for size in sizes:
+        movies = generate_movies(size)
+        # Fewer repeats on the large pools to keep a full run in minutes
+        size_repeat = max(1, repeat if size <= 100000 else repeat // 3)
+
+        for name, func in get_cases(movies).items():
+            timing = time_call(func, size_repeat)
+            results.setdefault(name, {})[str(size)] = timing
+            print(f"{name:<22} {size:>9,} movies  median {timing['median'] * 1000:10.2f} ms  min {timing['min'] * 1000:10.2f} ms")
+
+    return {
+        'meta': {
+            'created_at': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'repeat': repeat
+        },
+        'results': results
+    }
+
+def compare_results(baseline, current, tolerance):
+    """Return the cases whose best time got slower than the baseline by more than `tolerance`"""
+    regressions = []
+
+    for name, sizes in current['results'].items():
+        for size, timing in sizes.items():
+            base_timing = baseline['results'].get(name, {}).get(size)
+            if not base_timing:
+                continue
+
+            # Compare best-of-N times, which are far less noisy than medians
+            ratio = timing['min'] / max(base_timing['min'], 1e-9)
+            status = "REGRESSION" if ratio > 1 + tolerance else "ok"
+            print(f"{name:<22} {int(size):>9,} movies  {base_timing['min'] * 1000:10.2f} ms -> {timing['min'] * 1000:10.2f} ms  x{ratio:5.2f}  {status}")
+
+            if status != "ok":
+                regressions.append((name, size, ratio))
+
+    return regressions
+
+def run_startup(args):
+    """Time cold starts and save them to, or check them against, the baseline"""
+    startup = time_startup(args.repeat)
+    for name, timing in startup.items():
+        print(f"{name:<22} median {timing['median'] * 1000:10.1f} ms  min {timing['min'] * 1000:10.1f} ms")
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    if args.save:
+        baseline['startup'] = startup
+        with open(args.baseline, "w") as f:
+            json.dump(baseline, f, indent=2)
+        print(f"Startup timings saved to {args.baseline}")
+        return 0
+
+    if 'startup' not in baseline:
+        print(f"No startup baseline in {args.baseline}. Run `python benchmark.py startup --save` first.")
+        return 0
+
+    print()
+    regressions = []
+    for name, timing in startup.items():
+        base_timing = baseline['startup'].get(name)
+        if not base_timing:
+            continue
+        ratio = timing['min'] / max(base_timing['min'], 1e-9)
+        status = "REGRESSION" if ratio > 1 + args.tolerance else "ok"
+        print(f"{name:<22} {base_timing['min'] * 1000:10.1f} ms -> {timing['min'] * 1000:10.1f} ms  x{ratio:5.2f}  {status}")
+        if status != "ok":
+            regressions.append(name)
+
+    return 1 if regressions else 0
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the ChalChitra ranking and filtering hot paths")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    for command in ("run", "compare"):
+        subparser = subparsers.add_parser(command)
+        subparser.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)),
+                               help="Comma-separated candidate pool sizes")
+        subparser.add_argument("--repeat", type=int, default=5, help="Timed runs per case")
+        subparser.add_argument("--baseline", default=DEFAULT_BASELINE, help="Path of the JSON baseline")
+
+    subparsers.choices["run"].add_argument("--save", action="store_true", help="Store the results as the baseline")
+    subparsers.choices["compare"].add_argument("--tolerance", type=float, default=0.25,
+                                               help="Allowed slowdown before a case counts as a regression")
+
+    imports_parser = subparsers.add_parser("imports")
+    imports_parser.add_argument("--top", type=int, default=15, help="Packages to list")
+
+    startup_parser = subparsers.add_parser("startup")
+    startup_parser.add_argument("--repeat", type=int, default=5, help="Cold starts to time")
+    startup_parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="Path of the JSON baseline")
+    startup_parser.add_argument("--save", action="store_true", help="Store the timings in the baseline")
+    startup_parser.add_argument("--tolerance", type=float, default=0.25,
+                                help="Allowed slowdown before startup counts as a regression")
+
+    memory_parser = subparsers.add_parser("memory")
+    memory_parser.add_argument("--sessions", type=int, default=2000, help="Concurrent sessions to simulate")
+    memory_parser.add_argument("--per-session", type=int, default=100, help="Recommendations per session")
+    memory_parser.add_argument("--pool", type=int, default=2000, help="Popular movies the sessions draw from")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "memory":
+        results = measure_session_memory(args.sessions, args.per_session, args.pool)
+        for layout, usage in results.items():
+            print(f"{layout:<22} {usage['total_bytes'] / 2**20:10.1f} MB total  "
+                  f"{usage['per_session_bytes'] / 1024:8.1f} KB per session")
+        ratio = results['movie_dicts']['total_bytes'] / max(results['catalog_ids']['total_bytes'], 1)
+        print(f"\nCatalog ids hold x{ratio:.1f} less memory over {args.sessions:,} sessions")
+        return 0
+
+    if args.command == "imports":
+        packages = profile_imports()
+        for package, seconds in list(packages.items())[:args.top]:
+            print(f"{package:<22} {seconds * 1000:10.1f} ms")
+        print(f"{'total':<22} {sum(packages.values()) * 1000:10.1f} ms")
+        return 0
+
+    if args.command == "startup":
+        return run_startup(args)
+
+    sizes = [int(size) for size in args.sizes.split(",") if size.strip()]
+
+    if args.command == "run":
+        results = run_benchmarks(sizes, args.repeat)
+        if args.save:
+            with open(args.baseline, "w") as f:
+                json.dump(results, f, indent=2)
+            print(f"Baseline saved to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"No baseline found at {args.baseline}. Run `python benchmark.py run --save` first.")
+        return 2
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+
+    results = run_benchmarks(sizes, args.repeat)
+    print()
+    regressions = compare_results(baseline, results, args.tolerance)
+
+    if regressions:
+        print(f"\n{len(regressions)} case(s) slower than the baseline by more than {args.tolerance:.0%}")
+        return 1
+
+    print("\nNo regressions against the baseline")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
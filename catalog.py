@@ -0,0 +1,106 @@
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+# Movies held for all sessions; the least recently used are dropped past this
+CATALOG_MAX_MOVIES = int(os.getenv("CATALOG_MAX_MOVIES", "20000"))
+
+# The fields the movie lists show and filter on. Anything else (cast, providers,
+# trailers from get_movie_details) is dropped, so every entry stays list-sized
+# and CATALOG_MAX_MOVIES bounds the catalog's memory, not just its entry count.
+LIST_FIELDS = (
+    'id', 'title', 'poster_path', 'release_date', 'vote_average', 'overview',
+    'genre_ids', 'genres', 'original_language', 'backdrop_path', 'runtime'
+)
+
+def slim_movie(movie):
+    """Keep only the LIST_FIELDS of a movie dict"""
+    return {field: movie[field] for field in LIST_FIELDS if field in movie}
+
+class MovieCatalog:
+    """
+    Process-wide, size-bounded cache of movie data keyed by tmdb_id
+
+    Sessions keep ordered tmdb_id arrays and resolve them here, so a movie
+    recommended to thousands of users is held once instead of once per
+    session. Movies dropped from the cache are reloaded when next resolved:
+    from the movies table if they were saved (rated or watched), and from
+    TMDB otherwise, since most recommended movies are never saved. Only the
+    LIST_FIELDS are kept; the details view fetches the full movie itself.
+    The dicts handed out are shared between sessions and must not be modified.
+    """
+    def __init__(self, max_movies=CATALOG_MAX_MOVIES):
+        self.max_movies = max_movies
+        self._movies = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "loaded": 0, "fetched": 0, "evicted": 0}
+
+    def put(self, movies):
+        """Add or refresh movies, returning their tmdb_ids in order"""
+        with self._lock:
+            for movie in movies:
+                self._movies[movie['id']] = slim_movie(movie)
+                self._movies.move_to_end(movie['id'])
+            while len(self._movies) > self.max_movies:
+                self._movies.popitem(last=False)
+                self._stats["evicted"] += 1
+
+        return np.fromiter((movie['id'] for movie in movies), dtype=np.int64, count=len(movies))
+
+    def get(self, tmdb_ids):
+        """Resolve tmdb_ids to movies in the same order, leaving out ids that can't be found"""
+        tmdb_ids = [int(tmdb_id) for tmdb_id in tmdb_ids]
+        found = {}
+
+        with self._lock:
+            for tmdb_id in tmdb_ids:
+                movie = self._movies.get(tmdb_id)
+                if movie is not None:
+                    self._movies.move_to_end(tmdb_id)
+                    found[tmdb_id] = movie
+            missing = list(dict.fromkeys(tmdb_id for tmdb_id in tmdb_ids if tmdb_id not in found))
+            self._stats["hits"] += len(tmdb_ids) - len(missing)
+            self._stats["misses"] += len(missing)
+
+        if missing:
+            # Only evicted movies get here, so the database and TMDB clients stay off the import path
+            import database as db
+
+            loaded = db.get_movies_by_tmdb_ids(missing)
+            loaded_ids = {movie['id'] for movie in loaded}
+
+            # Movies nobody rated or watched were never saved
+            from tmdb_api import get_movie_details
+
+            fetched = [get_movie_details(tmdb_id) for tmdb_id in missing if tmdb_id not in loaded_ids]
+            fetched = [movie for movie in fetched if movie]
+
+            self.put(loaded + fetched)
+            found.update((movie['id'], slim_movie(movie)) for movie in loaded + fetched)
+            with self._lock:
+                self._stats["loaded"] += len(loaded)
+                self._stats["fetched"] += len(fetched)
+
+        return [found[tmdb_id] for tmdb_id in tmdb_ids if tmdb_id in found]
+
+    def get_stats(self):
+        """Get the catalog size and hit/miss counters"""
+        with self._lock:
+            return dict(self._stats, size=len(self._movies), max_size=self.max_movies)
+
+# One catalog per server process, shared by all sessions
+catalog = MovieCatalog()
+
+def remember_movies(movies):
+    """Put movies in the shared catalog and return their tmdb_ids as an int64 array"""
+    return catalog.put(movies)
+
+def resolve_movies(tmdb_ids):
+    """Get the movies for tmdb_ids from the shared catalog, in order"""
+    return catalog.get(tmdb_ids)
+
+def get_catalog_stats():
+    """Get the shared catalog's size and hit/miss counters"""
+    return catalog.get_stats()
@@ -0,0 +1,106 @@
+import os
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+from sqlalchemy import DateTime, text
+
+import database as db
+
+# Tables exported for the offline recommender pipelines: (query, schema).
+# The schemas fix column types across chunks; DateTime columns are typed in
+# the query too so SQLite's text timestamps arrive as datetimes.
+EXPORTS = {
+    "ratings": (
+        text("""
+            SELECT r.id, r.user_id, m.tmdb_id, r.rating, r.created_at
+            FROM user_ratings r
+            JOIN movies m ON r.movie_id = m.id
+            ORDER BY r.id
+        """).columns(created_at=DateTime),
+        pa.schema([
+            ("id", pa.int64()),
+            ("user_id", pa.int64()),
+            ("tmdb_id", pa.int64()),
+            ("rating", pa.int32()),
+            ("created_at", pa.timestamp("us"))
+        ])
+    ),
+    "watched": (
+        text("""
+            SELECT v.user_id, m.tmdb_id, v.view_count, v.first_watched_at, v.last_watched_at
+            FROM user_movie_views v
+            JOIN movies m ON v.movie_id = m.id
+            ORDER BY v.user_id, v.movie_id
+        """).columns(first_watched_at=DateTime, last_watched_at=DateTime),
+        pa.schema([
+            ("user_id", pa.int64()),
+            ("tmdb_id", pa.int64()),
+            ("view_count", pa.int32()),
+            ("first_watched_at", pa.timestamp("us")),
+            ("last_watched_at", pa.timestamp("us"))
+        ])
+    ),
+    "watch_events": (
+        text("""
+            SELECT e.user_id, m.tmdb_id, e.watched_at
+            FROM watch_events e
+            JOIN movies m ON e.movie_id = m.id
+            ORDER BY e.watched_at
+        """).columns(watched_at=DateTime),
+        pa.schema([
+            ("user_id", pa.int64()),
+            ("tmdb_id", pa.int64()),
+            ("watched_at", pa.timestamp("us"))
+        ])
+    ),
+    "movies": (
+        text("""
+            SELECT id, tmdb_id, title, release_date, vote_average, original_language, runtime
+            FROM movies
+            ORDER BY id
+        """),
+        pa.schema([
+            ("id", pa.int64()),
+            ("tmdb_id", pa.int64()),
+            ("title", pa.string()),
+            ("release_date", pa.string()),
+            ("vote_average", pa.float64()),
+            ("original_language", pa.string()),
+            ("runtime", pa.int32())
+        ])
+    ),
+    "movie_genres": (
+        text("""
+            SELECT m.tmdb_id, g.tmdb_id AS genre_tmdb_id, g.name AS genre_name
+            FROM movie_genres mg
+            JOIN movies m ON mg.movie_id = m.id
+            JOIN genres g ON mg.genre_id = g.id
+            ORDER BY mg.movie_id, mg.genre_id
+        """),
+        pa.schema([
+            ("tmdb_id", pa.int64()),
+            ("genre_tmdb_id", pa.int64()),
+            ("genre_name", pa.string())
+        ])
+    )
+}
+
+def export_parquet(name, path, chunk_size=db.DB_STREAM_CHUNK_SIZE):
+    """
+    Stream one export table into a Parquet file, one row group per chunk
+
+    Returns:
+    int: Number of rows written
+    """
+    query, schema = EXPORTS[name]
+    rows = 0
+
+    # Write to a temporary file so readers never see a half-written export
+    partial_path = path + ".partial"
+    with pq.ParquetWriter(partial_path, schema) as writer:
+        for batch in db.stream_query_record_batches(query, chunk_size=chunk_size, schema=schema):
+            writer.write_batch(batch)
+            rows += batch.num_rows
+    os.replace(partial_path, path)
+
+    return rows
@@ -0,0 +1,125 @@
+import atexit
+import logging
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from recommendation_engine import get_recommendation_page
+
+# Recommendations shown per "Show more" on the home page
+FEED_PAGE_SIZE = int(os.getenv("FEED_PAGE_SIZE", "8"))
+# Threads computing next pages in the background, shared by all sessions
+FEED_PREFETCH_WORKERS = int(os.getenv("FEED_PREFETCH_WORKERS", "4"))
+# Prefetched pages held for their sessions; the oldest are dropped past this
+FEED_PREFETCH_MAX_PAGES = int(os.getenv("FEED_PREFETCH_MAX_PAGES", "1000"))
+# Seconds "Show more" waits for a prefetch still running before computing the page itself
+FEED_TAKE_TIMEOUT = float(os.getenv("FEED_TAKE_TIMEOUT", "5"))
+
+logger = logging.getLogger("chalchitra.feed")
+
+class FeedPrefetcher:
+    """
+    Compute recommendation feed pages ahead of time on worker threads
+
+    While a session shows one page of its feed, the next TMDB discover page
+    is fetched and ranked here, so "Show more" only has to pick it up.
+    Pages are keyed by (feed_id, page) and handed out once; a page nobody
+    asked for ahead of time is computed on the spot.
+    """
+    def __init__(self, workers=FEED_PREFETCH_WORKERS, max_pages=FEED_PREFETCH_MAX_PAGES,
+                 take_timeout=FEED_TAKE_TIMEOUT):
+        self.max_pages = max_pages
+        self.take_timeout = take_timeout
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="feed-prefetch")
+        self._pages = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"prefetched": 0, "ready": 0, "waited": 0, "computed": 0, "timed_out": 0,
+                       "failed": 0, "evicted": 0}
+
+    def prefetch(self, feed_id, page, preferences, seen_ids=None, listed_ids=None):
+        """Start computing a page unless it is already on its way; returns immediately"""
+        key = (feed_id, page)
+
+        with self._lock:
+            if key in self._pages:
+                return
+            self._pages[key] = self._executor.submit(get_recommendation_page, preferences, page, seen_ids, listed_ids)
+            self._stats["prefetched"] += 1
+            while len(self._pages) > self.max_pages:
+                _, future = self._pages.popitem(last=False)
+                future.cancel()
+                self._stats["evicted"] += 1
+
+    def take(self, feed_id, page, preferences, seen_ids=None, listed_ids=None):
+        """
+        Get a page, prefetched if possible
+
+        A prefetch still running is waited for up to take_timeout seconds;
+        past that it is cancelled (or left to finish unused) and the page is
+        computed here instead.
+
+        Returns:
+        tuple: (movies, scores, whether there are more pages), or None if the page couldn't be computed
+        """
+        with self._lock:
+            future = self._pages.pop((feed_id, page), None)
+            if future is None:
+                self._stats["computed"] += 1
+            else:
+                self._stats["ready" if future.done() else "waited"] += 1
+
+        try:
+            page_result = None
+            if future is not None:
+                try:
+                    page_result = future.result(timeout=self.take_timeout)
+                except TimeoutError:
+                    future.cancel()
+                    with self._lock:
+                        self._stats["timed_out"] += 1
+                    logger.warning("feed %s page %d prefetch timed out after %.1f s; computing it now",
+                                   feed_id, page, self.take_timeout)
+            if page_result is None:
+                page_result = get_recommendation_page(preferences, page, seen_ids, listed_ids)
+            movies, scores, has_more = page_result
+        except Exception as e:
+            with self._lock:
+                self._stats["failed"] += 1
+            logger.warning("feed %s page %d failed: %s", feed_id, page, e)
+            return None
+
+        # The user may have seen more movies since the page was prefetched
+        if seen_ids is not None and len(seen_ids) and movies:
+            movie_ids = np.fromiter((movie['id'] for movie in movies), dtype=np.int64, count=len(movies))
+            unseen = ~np.isin(movie_ids, seen_ids)
+            movies = [movie for movie, keep in zip(movies, unseen) if keep]
+            scores = scores[unseen]
+
+        return movies, scores, has_more
+
+    def get_stats(self):
+        """Get the number of pages held and how takes were served"""
+        with self._lock:
+            return dict(self._stats, pending=len(self._pages))
+
+    def stop(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+# One prefetcher per server process, shared by all sessions
+prefetcher = FeedPrefetcher()
+atexit.register(prefetcher.stop)
+
+def prefetch_page(feed_id, page, preferences, seen_ids=None, listed_ids=None):
+    """Compute a feed page in the background so a later take_page returns at once"""
+    prefetcher.prefetch(feed_id, page, preferences, seen_ids, listed_ids)
+
+def take_page(feed_id, page, preferences, seen_ids=None, listed_ids=None):
+    """Get a feed page, from the prefetch if it was started"""
+    return prefetcher.take(feed_id, page, preferences, seen_ids, listed_ids)
+
+def get_feed_stats():
+    """Get the shared prefetcher's counters"""
+    return prefetcher.get_stats()
@@ -0,0 +1,482 @@
+"""
+Headless load test: many concurrent sessions running scripted user journeys
+
+Each simulated user is a fresh Streamlit session driven through app.py with
+the app-testing API: open -> login -> quiz -> the Trending, History and
+Similar tabs -> a movie's details -> rate it. TMDB is replaced by a local
+stand-in server with a synthetic catalog, and the database defaults to a
+throwaway SQLite file, so a run never touches real services.
+
+AppTest reruns the whole script for every interaction, including those a
+browser would send to a fragment, so step latencies are upper bounds.
+
+Usage:
+    python loadtest.py run                               # concurrency levels 1, 10 and 50
+    python loadtest.py run --concurrency 5,20 --journeys 2
+    python loadtest.py run --database-url postgresql://...   # against a local Postgres
+    python loadtest.py run --json loadtest.json          # ...and save the results
+    python loadtest.py tmdb --port 8765                  # serve only the TMDB stand-in, for
+                                                         # `TMDB_BASE_URL=http://127.0.0.1:8765 streamlit run app.py`
+"""
+import argparse
+import gc
+import json
+import os
+import random
+import re
+import resource
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from benchmark import GENRES, generate_movies
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")
+DEFAULT_CONCURRENCY = [1, 10, 50]
+# Seconds one rerun may take before the journey counts as failed
+RERUN_TIMEOUT = 120
+PAGE_SIZE = 20
+PASSWORD = "loadtest-password"
+
+# Steps in journey order
+STEPS = ["open", "login", "quiz", "trending", "history", "similar", "details", "rate"]
+# Single genres, so the quiz's discover query has plenty of results
+QUIZ_GENRES = ["Drama", "Comedy", "Action", "Thriller", "Horror", "Romance"]
+
+class TmdbStandIn:
+    """
+    Local HTTP server answering the TMDB endpoints the app calls
+
+    Serves a synthetic catalog from benchmark.generate_movies, with an
+    optional fixed latency per request to mimic the real API.
+    """
+    def __init__(self, movie_count=5000, latency=0.0, host="127.0.0.1", port=0):
+        self.latency = latency
+        self.requests = 0
+        self.movies = [self._list_result(movie) for movie in generate_movies(movie_count)]
+        self.by_id = {movie['id']: movie for movie in self.movies}
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, name="tmdb-stand-in", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _list_result(self, movie):
+        """Shape a generated movie like an entry of TMDB's list results"""
+        return {
+            'id': movie['id'],
+            'title': movie['title'],
+            'poster_path': f"/poster{movie['id']}.jpg",
+            'backdrop_path': f"/backdrop{movie['id']}.jpg",
+            'release_date': movie['release_date'],
+            'vote_average': movie['vote_average'],
+            'overview': movie['overview'],
+            'genre_ids': movie['genre_ids'],
+            'original_language': movie['original_language']
+        }
+
+    def _details(self, movie):
+        return dict(
+            movie,
+            genres=[{'id': genre_id, 'name': GENRES[genre_id][0]} for genre_id in movie['genre_ids']],
+            runtime=80 + movie['id'] % 70,
+            tagline="",
+            budget=0,
+            revenue=0,
+            production_companies=[],
+            credits={
+                'cast': [{'name': f"Actor {movie['id']}-{n}", 'character': f"Role {n}"} for n in range(5)],
+                'crew': [{'name': f"Director {movie['id']}", 'job': "Director"}]
+            },
+            videos={'results': []}
+        )
+
+    def _page(self, movies, query):
+        page = int(query.get('page', ['1'])[0])
+        results = movies[(page - 1) * PAGE_SIZE:page * PAGE_SIZE]
+        return {
+            'page': page,
+            'results': results,
+            'total_results': len(movies),
+            'total_pages': (len(movies) + PAGE_SIZE - 1) // PAGE_SIZE
+        }
+
+    def _discover(self, query):
+        movies = self.movies
+        # Comma-separated genres must all match, like TMDB's with_genres
+        genres = [int(genre_id) for genre_id in query.get('with_genres', [''])[0].split(",") if genre_id]
+        if genres:
+            movies = [movie for movie in movies if all(genre_id in movie['genre_ids'] for genre_id in genres)]
+        languages = [code for code in query.get('with_original_language', [''])[0].split(",") if code]
+        if languages:
+            movies = [movie for movie in movies if movie['original_language'] in languages]
+        if 'primary_release_date.gte' in query:
+            movies = [movie for movie in movies if movie['release_date'] >= query['primary_release_date.gte'][0]]
+        if 'primary_release_date.lte' in query:
+            movies = [movie for movie in movies if movie['release_date'] <= query['primary_release_date.lte'][0]]
+        if 'vote_average.gte' in query:
+            movies = [movie for movie in movies if movie['vote_average'] >= float(query['vote_average.gte'][0])]
+        return self._page(movies, query)
+
+    def respond(self, path, query):
+        """Return (status, JSON body) for a request path and parsed query string"""
+        if path == "/genre/movie/list":
+            return 200, {'genres': [{'id': genre_id, 'name': name} for genre_id, (name, _) in GENRES.items()]}
+        if path == "/trending/movie/week":
+            return 200, self._page(self.movies, query)
+        if path == "/discover/movie":
+            return 200, self._discover(query)
+        if path == "/search/movie":
+            text = query.get('query', [''])[0].lower()
+            return 200, self._page([movie for movie in self.movies if text in movie['title'].lower()], query)
+
+        match = re.fullmatch(r"/movie/(\d+)(/similar)?", path)
+        if match and int(match.group(1)) in self.by_id:
+            movie = self.by_id[int(match.group(1))]
+            if not match.group(2):
+                return 200, self._details(movie)
+            similar = [other for other in self.movies
+                       if other['id'] != movie['id'] and other['genre_ids'][0] == movie['genre_ids'][0]]
+            return 200, self._page(similar, query)
+
+        return 404, {'status_code': 34, 'status_message': "The resource you requested could not be found."}
+
+    def _handler(self):
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                url = urlparse(self.path)
+                stand_in.requests += 1
+                if stand_in.latency:
+                    time.sleep(stand_in.latency)
+
+                status, body = stand_in.respond(url.path, parse_qs(url.query))
+                payload = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+class JourneyError(Exception):
+    """A journey step raised in the app or didn't render what the next step needs"""
+    def __init__(self, step, message):
+        super().__init__(f"{step}: {message}")
+        self.step = step
+
+def rss_bytes():
+    """Resident set size of this process, or the peak where the current size isn't available"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is in kilobytes on Linux and bytes on macOS
+        return peak if sys.platform == "darwin" else peak * 1024
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a non-empty list"""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+def _find(elements, label):
+    for element in elements:
+        if element.label == label:
+            return element
+    raise LookupError(f"no widget labelled {label!r}")
+
+def _find_grid(app_test, key):
+    """Find the movie_grid component with a key, returning (element, movie ids)"""
+    pending = [app_test._tree]
+    while pending:
+        node = pending.pop()
+        proto = getattr(node, "proto", None)
+        if type(node).__name__ == "UnknownElement" and proto.id.endswith(f"-{key}"):
+            return node, [card['id'] for card in json.loads(proto.json)]
+        children = getattr(node, "children", None)
+        if isinstance(children, dict):
+            pending.extend(children.values())
+    return None, []
+
+def click_grid(app_test, key, movie_id):
+    """Send the click a browser would send for a poster in a movie grid, and rerun"""
+    from streamlit.components.v2.bidi_component.constants import EVENT_DELIM
+    from streamlit.runtime.state.session_state import STREAMLIT_INTERNAL_KEY_PREFIX
+
+    grid, _ = _find_grid(app_test, key)
+    widget_states = app_test._tree.get_widget_states()
+    trigger = widget_states.widgets.add()
+    trigger.id = f"{STREAMLIT_INTERNAL_KEY_PREFIX}_{grid.proto.id}{EVENT_DELIM}events"
+    trigger.json_trigger_value = json.dumps([{"event": "select", "value": movie_id}])
+    app_test._run(widget_states)
+
+def share_test_runtime():
+    """
+    Make concurrent AppTest runs share server state the way sessions do
+
+    AppTest installs a mock Runtime in a process-wide class attribute for
+    each run and clears it afterwards, so one session finishing would pull
+    the runtime out from under the others. The mocks are interchangeable,
+    so fall back to the last one installed. The same goes for the config
+    override each run patches in and out, which is set once here instead.
+    Each run also compiles the script into a new cache, which a server does
+    once (and which isn't thread-safe on Python 3.11), so hand every run the
+    same cache.
+    """
+    from contextlib import nullcontext
+
+    from streamlit import config
+    from streamlit.runtime import Runtime
+    from streamlit.runtime.scriptrunner.script_cache import ScriptCache
+    from streamlit.testing.v1 import app_test, local_script_runner
+    from streamlit.testing.v1.util import build_mock_config_get_option
+
+    config.get_option = build_mock_config_get_option({"global.appTest": True})
+    app_test.patch_config_options = lambda overrides: nullcontext()
+
+    script_cache = ScriptCache()
+    app_test.ScriptCache = local_script_runner.ScriptCache = lambda: script_cache
+
+    last = []
+
+    def instance(cls):
+        if cls._instance is not None:
+            last[:] = [cls._instance]
+        elif last:
+            return last[0]
+        if cls._instance is None:
+            raise RuntimeError("Runtime hasn't been created!")
+        return cls._instance
+
+    def exists(cls):
+        return cls._instance is not None or bool(last)
+
+    Runtime.instance = classmethod(instance)
+    Runtime.exists = classmethod(exists)
+
+def run_journey(username, rng, record):
+    """Drive one new session through every step, passing each step's rerun time to record()"""
+    from streamlit.testing.v1 import AppTest
+
+    app_test = AppTest.from_file(APP_PATH, default_timeout=RERUN_TIMEOUT)
+
+    def step(name, action):
+        started = time.perf_counter()
+        action()
+        record(name, time.perf_counter() - started)
+        if app_test.exception:
+            raise JourneyError(name, app_test.exception[0].message)
+
+    def open_tab(label):
+        app_test.session_state['home_tab'] = label
+        app_test.run()
+
+    step("open", app_test.run)
+
+    _find(app_test.text_input, "Username").input(username)
+    _find(app_test.text_input, "Password").input(PASSWORD)
+    step("login", _find(app_test.button, "Login").click().run)
+    if not app_test.session_state['is_authenticated']:
+        raise JourneyError("login", "not logged in")
+
+    _find(app_test.multiselect, "Select up to 3 genres").set_value([rng.choice(QUIZ_GENRES)])
+    step("quiz", _find(app_test.button, "Get Recommendations").click().run)
+    if not len(app_test.session_state['recommended_ids']):
+        raise JourneyError("quiz", "no recommendations")
+
+    step("trending", lambda: open_tab("Trending"))
+    step("history", lambda: open_tab("Your History"))
+    step("similar", lambda: open_tab("Similar Movies"))
+
+    _, movie_ids = _find_grid(app_test, "sim_grid")
+    if not movie_ids:
+        raise JourneyError("similar", "no similar movies to open")
+    movie_id = rng.choice(movie_ids)
+    step("details", lambda: click_grid(app_test, "sim_grid", movie_id))
+
+    _find(app_test.slider, "Your rating").set_value(rng.randint(1, 10))
+    step("rate", app_test.button(key=f"rate_btn_{movie_id}").click().run)
+    if not app_test.success:
+        raise JourneyError("rate", "rating not confirmed")
+
+def run_level(concurrency, journeys, run_id, seed):
+    """Run concurrency * journeys journeys on `concurrency` sessions at a time"""
+    import database as db
+
+    usernames = [f"lt{run_id}c{concurrency}n{index}" for index in range(concurrency * journeys)]
+    for username in usernames:
+        db.create_user_account(username, PASSWORD)
+
+    timings = {step: [] for step in STEPS}
+    failures = {}
+    lock = threading.Lock()
+
+    def record(step, seconds):
+        with lock:
+            timings[step].append(seconds)
+
+    def journey(index):
+        try:
+            run_journey(usernames[index], random.Random(seed + index), record)
+        except Exception as e:
+            if isinstance(e, JourneyError):
+                step, message = e.step, str(e)
+            else:
+                step, message = "unknown", f"{type(e).__name__}: {e}"
+            with lock:
+                failures.setdefault(step, []).append(message)
+
+    # Sample memory while the level runs to catch its peak
+    gc.collect()
+    rss_before = rss_bytes()
+    peak = [rss_before]
+    done = threading.Event()
+
+    def sample_memory():
+        while not done.wait(0.2):
+            peak[0] = max(peak[0], rss_bytes())
+
+    sampler = threading.Thread(target=sample_memory, daemon=True)
+    sampler.start()
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(journey, range(len(usernames))))
+    elapsed = time.perf_counter() - started
+
+    done.set()
+    sampler.join()
+    gc.collect()
+    rss_after = rss_bytes()
+
+    reruns = sum(len(values) for values in timings.values())
+    return {
+        'concurrency': concurrency,
+        'journeys': len(usernames),
+        'completed': len(usernames) - sum(len(errors) for errors in failures.values()),
+        'elapsed_s': elapsed,
+        'journeys_per_s': len(usernames) / elapsed,
+        'reruns_per_s': reruns / elapsed,
+        'rss_before_mb': rss_before / 2**20,
+        'rss_peak_mb': max(peak[0], rss_after) / 2**20,
+        'rss_after_mb': rss_after / 2**20,
+        'steps': {
+            step: {
+                'count': len(values),
+                'p50_ms': percentile(values, 0.50) * 1000,
+                'p95_ms': percentile(values, 0.95) * 1000,
+                'p99_ms': percentile(values, 0.99) * 1000,
+                'max_ms': max(values) * 1000
+            }
+            for step, values in timings.items() if values
+        },
+        'failures': {step: {'count': len(errors), 'first': errors[0]} for step, errors in failures.items()}
+    }
+
+def print_level(result):
+    print(f"\nConcurrency {result['concurrency']}: {result['completed']}/{result['journeys']} journeys "
+          f"in {result['elapsed_s']:.1f} s, {result['journeys_per_s']:.2f} journeys/s, "
+          f"{result['reruns_per_s']:.1f} reruns/s")
+    print(f"  RSS {result['rss_before_mb']:.0f} MB -> {result['rss_after_mb']:.0f} MB "
+          f"(peak {result['rss_peak_mb']:.0f} MB)")
+    print(f"  {'step':<10} {'count':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for step, stats in result['steps'].items():
+        print(f"  {step:<10} {stats['count']:>6} {stats['p50_ms']:>9.1f} {stats['p95_ms']:>9.1f} "
+              f"{stats['p99_ms']:>9.1f} {stats['max_ms']:>9.1f}")
+    for step, failure in result['failures'].items():
+        print(f"  {failure['count']} journeys failed at {step}, e.g. {failure['first']}")
+
+def run(args):
+    levels = [int(level) for level in args.concurrency.split(",") if level.strip()]
+
+    stand_in = TmdbStandIn(args.movies, args.tmdb_latency_ms / 1000).start()
+    # Set before the app modules are imported, since they read these at import time
+    os.environ["TMDB_BASE_URL"] = stand_in.base_url
+    os.environ["TMDB_API_KEY"] = "loadtest"
+    os.environ["DATABASE_URL"] = args.database_url or f"sqlite:///{tempfile.mkdtemp(prefix='loadtest-')}/loadtest.db"
+    print(f"TMDB stand-in at {stand_in.base_url}, database {os.environ['DATABASE_URL']}")
+
+    from migrations import run_migrations
+    import write_queue
+
+    run_migrations()
+    share_test_runtime()
+    run_id = uuid.uuid4().hex[:6]
+
+    results = []
+    try:
+        for level in levels:
+            result = run_level(level, args.journeys, run_id, args.seed)
+            print_level(result)
+            results.append(result)
+    finally:
+        write_queue.flush_pending()
+        stand_in.stop()
+
+    print(f"\nTMDB stand-in served {stand_in.requests} requests")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({'levels': results, 'tmdb_requests': stand_in.requests}, f, indent=2)
+        print(f"Results saved to {args.json}")
+
+    return 1 if any(result['failures'] for result in results) else 0
+
+def serve_tmdb(args):
+    stand_in = TmdbStandIn(args.movies, args.tmdb_latency_ms / 1000, port=args.port)
+    print(f"TMDB stand-in serving {len(stand_in.movies)} movies at {stand_in.base_url}")
+    try:
+        stand_in.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load-test the ChalChitra Streamlit app with concurrent sessions")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run")
+    run_parser.add_argument("--concurrency", default=",".join(map(str, DEFAULT_CONCURRENCY)),
+                            help="Comma-separated numbers of concurrent sessions")
+    run_parser.add_argument("--journeys", type=int, default=1, help="Journeys per session slot at each level")
+    run_parser.add_argument("--database-url", help="Database to run against (default: a new SQLite file)")
+    run_parser.add_argument("--seed", type=int, default=42, help="Seed for the journeys' choices")
+    run_parser.add_argument("--json", help="Also write the results to this JSON file")
+    run_parser.set_defaults(func=run)
+
+    tmdb_parser = subparsers.add_parser("tmdb")
+    tmdb_parser.add_argument("--port", type=int, default=8765, help="Port to listen on")
+    tmdb_parser.set_defaults(func=serve_tmdb)
+
+    for subparser in (run_parser, tmdb_parser):
+        subparser.add_argument("--movies", type=int, default=5000, help="Movies in the stand-in catalog")
+        subparser.add_argument("--tmdb-latency-ms", type=float, default=0.0,
+                               help="Delay added to every stand-in response")
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+if __name__ == "__main__":
+    sys.exit(main())
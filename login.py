@@ -83,7 +83,9 @@ def show_logout_button():
     """Show logout button in the sidebar"""
     if st.session_state.get('is_authenticated', False):
         if st.sidebar.button("Logout"):
-            # Clear authentication
+            # Revoke the token so it stops working everywhere, then clear authentication
+            if st.session_state.auth_token:
+                db.revoke_token(st.session_state.auth_token)
             st.session_state.is_authenticated = False
             st.session_state.user_id = None
             st.session_state.username = None
@@ -114,8 +116,15 @@ def authenticate():
     # Initialize authentication state
     init_auth_state()
     
-    # Initialize database tables
-    db.create_user_tables()
+    # End sessions whose token expired or was revoked (cached, so usually free);
+    # a failed lookup is not a rejection, so database errors don't log users out
+    if (st.session_state.is_authenticated
+            and db.validate_token(st.session_state.auth_token)[0] is None
+            and db.get_last_transaction_error() is None):
+        st.session_state.is_authenticated = False
+        st.session_state.user_id = None
+        st.session_state.username = None
+        st.session_state.auth_token = None
     
     # Show logout button in sidebar
     show_logout_button()
@@ -0,0 +1,124 @@
+"""
+Maintenance commands for the ChalChitra database
+
+Usage:
+    python manage.py migrate                # apply pending schema migrations (run on deploy)
+    python manage.py rebuild-movie-stats    # backfill or repair the movie_stats aggregates
+    python manage.py export --output-dir exports    # write ratings/watched/movies to Parquet
+    python manage.py compact-watch-events   # roll watch events up into view counts (run from cron)
+    python manage.py reap-tokens            # delete expired auth tokens (run from cron)
+    python manage.py replay-dead-letters    # write the events the write queue gave up on
+"""
+import argparse
+import os
+import sys
+
+import database as db
+import write_queue
+from migrations import run_migrations
+
+def migrate(args):
+    """Apply pending schema migrations"""
+    applied = run_migrations()
+    if applied:
+        print(f"Applied migrations: {', '.join(map(str, applied))}")
+    else:
+        print("Database schema is up to date")
+    return 0
+
+def rebuild_movie_stats(args):
+    """Recompute movie_stats from user_ratings"""
+    count = db.rebuild_movie_stats()
+    if count is None:
+        print("Failed to rebuild movie_stats")
+        return 1
+
+    print(f"Rebuilt movie_stats for {count} movies")
+    return 0
+
+def compact_watch_events(args):
+    """Roll watch events up into the view aggregates and maintain the log's partitions"""
+    count = db.compact_watch_events(args.lag)
+    if count is None or not db.maintain_watch_event_partitions():
+        print("Failed to compact watch events")
+        return 1
+
+    print(f"Compacted {count} watch events")
+    return 0
+
+def reap_tokens(args):
+    """Delete expired auth tokens"""
+    count = db.reap_expired_tokens(args.batch_size)
+    if db.get_last_transaction_error() is not None:
+        print(f"Failed to reap expired auth tokens after deleting {count}")
+        return 1
+
+    print(f"Deleted {count} expired auth tokens")
+    return 0
+
+def replay_dead_letters(args):
+    """Write the events in the write queue's dead-letter file"""
+    count = write_queue.replay_dead_letters(args.path)
+    if count is None:
+        print(f"Failed to replay {args.path}; its events were kept")
+        return 1
+
+    print(f"Replayed {count} events from {args.path}")
+    return 0
+
+def export(args):
+    """Write the export tables to Parquet files"""
+    # pyarrow is only needed here, so keep it out of the other commands
+    from exports import EXPORTS, export_parquet
+
+    tables = args.tables.split(",") if args.tables else list(EXPORTS)
+    unknown = [name for name in tables if name not in EXPORTS]
+    if unknown:
+        print(f"Unknown export tables: {', '.join(unknown)} (choose from {', '.join(EXPORTS)})")
+        return 2
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    for name in tables:
+        path = os.path.join(args.output_dir, f"{name}.parquet")
+        rows = export_parquet(name, path, args.chunk_size)
+        print(f"Exported {rows} rows to {path}")
+    return 0
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="ChalChitra database maintenance")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    subparser = subparsers.add_parser("migrate", help="Apply pending schema migrations")
+    subparser.set_defaults(func=migrate)
+
+    subparser = subparsers.add_parser("rebuild-movie-stats", help="Backfill or repair the movie_stats aggregates")
+    subparser.set_defaults(func=rebuild_movie_stats)
+
+    subparser = subparsers.add_parser("compact-watch-events",
+                                      help="Roll watch events up into per-user and per-movie view counts")
+    subparser.add_argument("--lag", type=int, default=db.WATCH_COMPACTION_LAG_SECONDS,
+                           help="Leave events younger than this many seconds for the next run")
+    subparser.set_defaults(func=compact_watch_events)
+
+    subparser = subparsers.add_parser("reap-tokens", help="Delete expired auth tokens")
+    subparser.add_argument("--batch-size", type=int, default=db.TOKEN_REAPER_BATCH_SIZE,
+                           help="Tokens deleted per transaction")
+    subparser.set_defaults(func=reap_tokens)
+
+    subparser = subparsers.add_parser("replay-dead-letters", help="Write the events the write queue gave up on")
+    subparser.add_argument("--path", default=write_queue.WRITE_QUEUE_DEAD_LETTER_FILE,
+                           help="Dead-letter file to replay")
+    subparser.set_defaults(func=replay_dead_letters)
+
+    subparser = subparsers.add_parser("export", help="Write ratings, watch history and movies to Parquet")
+    subparser.add_argument("--output-dir", default="exports", help="Directory for the .parquet files")
+    subparser.add_argument("--tables", help="Comma-separated tables to export (default: all)")
+    subparser.add_argument("--chunk-size", type=int, default=db.DB_STREAM_CHUNK_SIZE,
+                           help="Rows streamed and written per row group")
+    subparser.set_defaults(func=export)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+if __name__ == "__main__":
+    sys.exit(main())
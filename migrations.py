@@ -0,0 +1,297 @@
+from sqlalchemy import text
+
+import database as db
+from movie_data import FALLBACK_GENRES
+
+# Ordered schema migrations: (version, description, statements).
+# Applied versions are recorded in schema_migrations; never edit a released
+# migration, add a new one instead. Statements are formatted with the
+# backend's schema_types, e.g. {serial_pk} for an auto-increment primary key;
+# steps that differ by more than a type are callables taking the connection.
+MIGRATIONS = [
+    (1, "Create base schema", [
+        """
+        CREATE TABLE IF NOT EXISTS genres (
+            id {serial_pk},
+            tmdb_id INTEGER UNIQUE,
+            name VARCHAR(100) UNIQUE NOT NULL
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS users (
+            id {serial_pk},
+            session_id VARCHAR(255) UNIQUE,
+            username VARCHAR(100) UNIQUE,
+            password_hash VARCHAR(255),
+            email VARCHAR(255) UNIQUE,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS user_auth (
+            id {serial_pk},
+            user_id INTEGER REFERENCES users(id),
+            auth_token VARCHAR(255) UNIQUE,
+            expires_at TIMESTAMP,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS movies (
+            id {serial_pk},
+            tmdb_id INTEGER UNIQUE NOT NULL,
+            title VARCHAR(255) NOT NULL,
+            release_date VARCHAR(10),
+            poster_path TEXT,
+            vote_average FLOAT,
+            overview TEXT,
+            original_language VARCHAR(10),
+            backdrop_path TEXT,
+            runtime INTEGER,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS movie_genres (
+            movie_id INTEGER REFERENCES movies(id) ON DELETE CASCADE,
+            genre_id INTEGER REFERENCES genres(id) ON DELETE CASCADE,
+            PRIMARY KEY (movie_id, genre_id)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS user_ratings (
+            id {serial_pk},
+            user_id INTEGER REFERENCES users(id),
+            movie_id INTEGER REFERENCES movies(id),
+            rating INTEGER NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE (user_id, movie_id)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS user_watched_movies (
+            id {serial_pk},
+            user_id INTEGER REFERENCES users(id),
+            movie_id INTEGER REFERENCES movies(id),
+            watched_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE (user_id, movie_id)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS user_preferences (
+            id {serial_pk},
+            user_id INTEGER REFERENCES users(id) UNIQUE,
+            min_year INTEGER,
+            max_year INTEGER,
+            min_rating FLOAT,
+            preferred_languages {text_array},
+            runtime_range {int_array},
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS user_genre_preferences (
+            id {serial_pk},
+            user_id INTEGER REFERENCES users(id),
+            genre_id INTEGER REFERENCES genres(id),
+            UNIQUE (user_id, genre_id)
+        )
+        """,
+        # Seed the genres the quiz offers before TMDB has been reached
+        "INSERT INTO genres (tmdb_id, name) VALUES "
+        + ", ".join(f"({genre_id}, '{name}')" for genre_id, name in FALLBACK_GENRES.items())
+        + " ON CONFLICT DO NOTHING"
+    ]),
+    (2, "Add movie_stats rating aggregates", [
+        """
+        CREATE TABLE IF NOT EXISTS movie_stats (
+            movie_id INTEGER PRIMARY KEY REFERENCES movies(id),
+            rating_count INTEGER NOT NULL DEFAULT 0,
+            rating_sum BIGINT NOT NULL DEFAULT 0,
+            last_rated_at TIMESTAMP,
+            avg_rating DOUBLE PRECISION GENERATED ALWAYS AS
+                (CAST(rating_sum AS DOUBLE PRECISION) / NULLIF(rating_count, 0)) STORED
+        )
+        """,
+        # The popular list becomes a range scan over this partial index
+        """
+        CREATE INDEX IF NOT EXISTS idx_movie_stats_popular
+        ON movie_stats (avg_rating DESC)
+        WHERE rating_count >= """ + str(db.POPULAR_MIN_RATINGS),
+        # Backfill from ratings saved before the table existed
+        """
+        INSERT INTO movie_stats (movie_id, rating_count, rating_sum, last_rated_at)
+        SELECT movie_id, COUNT(*), SUM(rating), MAX(created_at)
+        FROM user_ratings
+        WHERE true
+        GROUP BY movie_id
+        ON CONFLICT (movie_id) DO NOTHING
+        """
+    ]),
+    # Token lookups already use the index behind the UNIQUE constraint on
+    # user_auth.auth_token, so only the per-user history scans need new ones.
+    (3, "Add history lookup indexes", [
+        """
+        CREATE INDEX IF NOT EXISTS idx_user_ratings_user_created
+        ON user_ratings (user_id, created_at DESC)
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS idx_user_watched_movies_user_watched
+        ON user_watched_movies (user_id, watched_at DESC)
+        """
+    ]),
+    # History pages seek on (timestamp, id), so the id tiebreaker joins the key
+    (4, "Add id to history indexes for keyset pagination", [
+        """
+        CREATE INDEX IF NOT EXISTS idx_user_ratings_user_created_id
+        ON user_ratings (user_id, created_at DESC, id DESC)
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS idx_user_watched_movies_user_watched_id
+        ON user_watched_movies (user_id, watched_at DESC, id DESC)
+        """,
+        "DROP INDEX IF EXISTS idx_user_ratings_user_created",
+        "DROP INDEX IF EXISTS idx_user_watched_movies_user_watched"
+    ]),
+    # Views become an append-only event log (monthly partitions on Postgres)
+    # that compact_watch_events rolls up into per-user and per-movie counts.
+    # user_watched_movies is no longer written; it seeds the rollups below.
+    (5, "Add watch_events log and view rollups", [
+        lambda conn: conn.execute(text("""
+            CREATE TABLE IF NOT EXISTS watch_events (
+                user_id INTEGER NOT NULL,
+                movie_id INTEGER NOT NULL,
+                watched_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+            )
+        """ + db.backend.partition_by_month("watched_at"))),
+        lambda conn: db.backend.create_month_partitions(conn, "watch_events", db.watch_event_partition_months()),
+        """
+        CREATE INDEX IF NOT EXISTS idx_watch_events_watched
+        ON watch_events (watched_at)
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS idx_watch_events_user_watched
+        ON watch_events (user_id, watched_at)
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS user_movie_views (
+            user_id INTEGER NOT NULL REFERENCES users(id),
+            movie_id INTEGER NOT NULL REFERENCES movies(id),
+            view_count INTEGER NOT NULL DEFAULT 0,
+            first_watched_at TIMESTAMP NOT NULL,
+            last_watched_at TIMESTAMP NOT NULL,
+            PRIMARY KEY (user_id, movie_id)
+        )
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS idx_user_movie_views_user_last
+        ON user_movie_views (user_id, last_watched_at DESC, movie_id DESC)
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS movie_view_stats (
+            movie_id INTEGER PRIMARY KEY REFERENCES movies(id),
+            view_count INTEGER NOT NULL DEFAULT 0,
+            last_watched_at TIMESTAMP
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS movie_daily_views (
+            day DATE NOT NULL,
+            movie_id INTEGER NOT NULL REFERENCES movies(id),
+            view_count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, movie_id)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS compaction_state (
+            name VARCHAR(100) PRIMARY KEY,
+            watermark TIMESTAMP NOT NULL
+        )
+        """,
+        "INSERT INTO compaction_state (name, watermark) VALUES ('watch_events', '1970-01-01 00:00:00') ON CONFLICT DO NOTHING",
+        # Seed the rollups with the views recorded before the log existed
+        """
+        INSERT INTO user_movie_views (user_id, movie_id, view_count, first_watched_at, last_watched_at)
+        SELECT user_id, movie_id, 1, watched_at, watched_at
+        FROM user_watched_movies
+        WHERE user_id IS NOT NULL AND movie_id IS NOT NULL AND watched_at IS NOT NULL
+        ON CONFLICT (user_id, movie_id) DO NOTHING
+        """,
+        """
+        INSERT INTO movie_view_stats (movie_id, view_count, last_watched_at)
+        SELECT movie_id, COUNT(*), MAX(watched_at)
+        FROM user_watched_movies
+        WHERE user_id IS NOT NULL AND movie_id IS NOT NULL AND watched_at IS NOT NULL
+        GROUP BY movie_id
+        ON CONFLICT (movie_id) DO NOTHING
+        """,
+        lambda conn: conn.execute(text(f"""
+            INSERT INTO movie_daily_views (day, movie_id, view_count)
+            SELECT {db.backend.day("watched_at")}, movie_id, COUNT(*)
+            FROM user_watched_movies
+            WHERE user_id IS NOT NULL AND movie_id IS NOT NULL AND watched_at IS NOT NULL
+            GROUP BY {db.backend.day("watched_at")}, movie_id
+            ON CONFLICT (day, movie_id) DO NOTHING
+        """))
+    ]),
+    # The token reaper deletes by expiry
+    (6, "Add user_auth expiry index", [
+        """
+        CREATE INDEX IF NOT EXISTS idx_user_auth_expires
+        ON user_auth (expires_at)
+        """
+    ]),
+    # user_watched_movies stopped being written in 5, so its history index is dead weight
+    (7, "Drop user_watched_movies history index", [
+        "DROP INDEX IF EXISTS idx_user_watched_movies_user_watched_id"
+    ])
+]
+
+def get_applied_versions(conn):
+    """Get the set of migration versions already applied"""
+    return {row[0] for row in conn.execute(text("SELECT version FROM schema_migrations"))}
+
+def run_migrations():
+    """
+    Apply pending migrations, each in its own transaction
+
+    Returns:
+    list: Versions applied by this call
+    """
+    applied = []
+
+    with db.engine.begin() as conn:
+        db.backend.lock_migrations(conn)
+        conn.execute(text("""
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                version INTEGER PRIMARY KEY,
+                description VARCHAR(255),
+                applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """))
+
+        applied_versions = get_applied_versions(conn)
+        pending = [migration for migration in MIGRATIONS if migration[0] not in applied_versions]
+
+    for version, description, statements in pending:
+        with db.engine.begin() as conn:
+            # Serialize workers; re-check inside the lock in case another one got here first
+            db.backend.lock_migrations(conn)
+            if version in get_applied_versions(conn):
+                continue
+
+            for statement in statements:
+                if callable(statement):
+                    statement(conn)
+                else:
+                    conn.execute(text(statement.format(**db.backend.schema_types)))
+
+            conn.execute(
+                text("INSERT INTO schema_migrations (version, description) VALUES (:version, :description)"),
+                {"version": version, "description": description}
+            )
+            applied.append(version)
+
+    return applied
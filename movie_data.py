@@ -6,7 +6,8 @@ import database as db
 
 # TMDB API configuration
 TMDB_API_KEY = os.getenv("TMDB_API_KEY", "")
-TMDB_BASE_URL = "https://api.themoviedb.org/3"
+# Same override as tmdb_api.TMDB_BASE_URL
+TMDB_BASE_URL = os.getenv("TMDB_BASE_URL", "https://api.themoviedb.org/3")
 
 # Fallback genre mapping if API fails
 FALLBACK_GENRES = {
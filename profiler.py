@@ -0,0 +1,307 @@
+import datetime
+import functools
+import json
+import logging
+import os
+import threading
+import time
+
+# File to append one JSON line per profiled rerun to, for offline analysis
+PROFILE_LOG = os.getenv("CHALCHITRA_PROFILE_LOG")
+# Opt-in: build a timing tree for every rerun and show it in the sidebar
+PROFILE_ENABLED = os.getenv("CHALCHITRA_PROFILE", "false").lower() in ("1", "true", "yes") or bool(PROFILE_LOG)
+# Spans kept per rerun; past this they only add to the timers
+MAX_PROFILE_SPANS = 500
+# Finished reruns kept per session for the overlay and its download
+MAX_SESSION_PROFILES = 20
+
+profile_logger = logging.getLogger("chalchitra.profile")
+if PROFILE_LOG:
+    _handler = logging.FileHandler(PROFILE_LOG)
+    _handler.setFormatter(logging.Formatter("%(message)s"))
+    profile_logger.addHandler(_handler)
+    profile_logger.setLevel(logging.INFO)
+    profile_logger.propagate = False
+
+# The rerun being profiled on this thread. Each session's script runs on
+# its own thread, so work done on background threads isn't attributed to
+# any rerun.
+_local = threading.local()
+
+class _Span:
+    """Time a block into the current rerun's tree (or, with node=False, only its timers)"""
+    __slots__ = ("profile", "name", "attrs", "node", "started")
+
+    def __init__(self, profile, name, attrs, node=True):
+        self.profile = profile
+        self.name = name
+        self.attrs = attrs
+        self.node = node
+
+    def __enter__(self):
+        profile = self.profile
+        if self.node and profile["span_count"] < MAX_PROFILE_SPANS:
+            profile["span_count"] += 1
+            self.node = dict(self.attrs, name=self.name, children=[])
+            profile["stack"][-1]["children"].append(self.node)
+            profile["stack"].append(self.node)
+        else:
+            if self.node:
+                profile["dropped_spans"] += 1
+            self.node = None
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        ended = time.perf_counter()
+        elapsed_ms = (ended - self.started) * 1000
+        _add_timing(self.profile, self.name, elapsed_ms)
+        if self.node is not None:
+            self.node["start_ms"] = round((self.started - self.profile["started"]) * 1000, 3)
+            self.node["ms"] = round(elapsed_ms, 3)
+            if exc_type is not None:
+                self.node["error"] = exc_type.__name__
+            self.profile["stack"].pop()
+        return False
+
+class _NoSpan:
+    """Stand-in returned when nothing is being profiled"""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+_NO_SPAN = _NoSpan()
+
+def _add_timing(profile, name, elapsed_ms):
+    timer = profile["timers"].get(name)
+    if timer is None:
+        profile["timers"][name] = {"count": 1, "ms": elapsed_ms}
+    else:
+        timer["count"] += 1
+        timer["ms"] += elapsed_ms
+
+def _current_profile():
+    return getattr(_local, "profile", None)
+
+def _in_fragment_run():
+    """True when Streamlit is rerunning only fragments, not the whole script"""
+    from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+    ctx = get_script_run_ctx()
+    return ctx is not None and bool(ctx.fragment_ids_this_run)
+
+def start_rerun(name="script", fragment=False):
+    """
+    Start profiling a rerun on this thread (call at the top of every script run)
+
+    A rerun still open here was cut short by st.rerun(), st.stop() or an
+    exception, and is finished as interrupted first.
+    """
+    if not PROFILE_ENABLED:
+        return
+
+    if _current_profile() is not None:
+        finish_rerun(interrupted=True)
+
+    root = {"name": name, "children": []}
+    _local.profile = {
+        "root": root,
+        "stack": [root],
+        "timers": {},
+        "span_count": 0,
+        "dropped_spans": 0,
+        "fragment": fragment,
+        "at": datetime.datetime.now().isoformat(timespec="milliseconds"),
+        "started": time.perf_counter()
+    }
+
+def finish_rerun(interrupted=False):
+    """
+    Finish the rerun profiled on this thread
+
+    The profile is kept in the session for the overlay and, if
+    CHALCHITRA_PROFILE_LOG is set, appended to that file as a JSON line.
+
+    Returns:
+    dict: The finished profile, or None if no rerun was being profiled
+    """
+    profile = _current_profile()
+    if profile is None:
+        return None
+    _local.profile = None
+
+    root = profile["root"]
+    result = {
+        "at": profile["at"],
+        "name": root["name"],
+        "fragment": profile["fragment"],
+        "interrupted": interrupted,
+        "ms": round((time.perf_counter() - profile["started"]) * 1000, 3),
+        "spans": root["children"],
+        "timers": {
+            name: {"count": timer["count"], "ms": round(timer["ms"], 3)}
+            for name, timer in sorted(profile["timers"].items(), key=lambda item: -item[1]["ms"])
+        },
+        "dropped_spans": profile["dropped_spans"]
+    }
+    result.update((key, value) for key, value in root.items() if key not in ("name", "children"))
+
+    session_state = _get_script_session_state()
+    if session_state is not None:
+        result.setdefault("session_id", session_state.get("session_id"))
+        profiles = session_state.setdefault("rerun_profiles", [])
+        profiles.append(result)
+        del profiles[:-MAX_SESSION_PROFILES]
+
+    if PROFILE_LOG:
+        profile_logger.info(json.dumps(result, default=str))
+
+    return result
+
+def _get_script_session_state():
+    """Get st.session_state, or None outside a Streamlit script run"""
+    import streamlit as st
+    from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+    return st.session_state if get_script_run_ctx() is not None else None
+
+def annotate(**attrs):
+    """Attach attributes, e.g. the current view, to the rerun being profiled"""
+    profile = _current_profile()
+    if profile is not None:
+        profile["root"].update(attrs)
+
+def span(name, **attrs):
+    """
+    Time a block as a node of the current rerun's tree
+
+        with profiler.span("rank", candidates=len(movies)):
+            ...
+
+    Costs one thread-local lookup when profiling is off.
+    """
+    profile = _current_profile()
+    if profile is None:
+        return _NO_SPAN
+    return _Span(profile, name, attrs)
+
+def timer(name):
+    """Time a block into the current rerun's per-name totals only, for code run too often to be nodes"""
+    profile = _current_profile()
+    if profile is None:
+        return _NO_SPAN
+    return _Span(profile, name, None, node=False)
+
+def record(name, elapsed_ms, **attrs):
+    """Add a span that was timed elsewhere, such as a database statement, ending now"""
+    profile = _current_profile()
+    if profile is None:
+        return
+
+    _add_timing(profile, name, elapsed_ms)
+    if profile["span_count"] >= MAX_PROFILE_SPANS:
+        profile["dropped_spans"] += 1
+        return
+    profile["span_count"] += 1
+    profile["stack"][-1]["children"].append(dict(
+        attrs,
+        name=name,
+        children=[],
+        start_ms=round((time.perf_counter() - profile["started"]) * 1000 - elapsed_ms, 3),
+        ms=round(elapsed_ms, 3)
+    ))
+
+def timed(name=None):
+    """Decorator timing each call of a function as a span, named module.function by default"""
+    def decorator(func):
+        label = name or f"{func.__module__}.{func.__name__}"
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            profile = _current_profile()
+            if profile is None:
+                return func(*args, **kwargs)
+            with _Span(profile, label, {}):
+                return func(*args, **kwargs)
+
+        return wrapper
+    return decorator
+
+class _FragmentSpan:
+    """Profile a fragment-only rerun on its own, or time the fragment as a span of the full rerun"""
+    __slots__ = ("name", "span")
+
+    def __init__(self, name):
+        self.name = name
+        self.span = None
+
+    def __enter__(self):
+        profile = _current_profile()
+        # Fragments nested in the fragment being rerun are spans of its profile
+        if profile is not None and (profile["fragment"] or not _in_fragment_run()):
+            self.span = _Span(profile, self.name, {})
+            self.span.__enter__()
+        else:
+            start_rerun(self.name, fragment=True)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.span is not None:
+            return self.span.__exit__(exc_type, exc, tb)
+        # st.rerun() from inside the fragment ends its run early
+        finish_rerun(interrupted=exc_type is not None)
+        return False
+
+def fragment(name=None):
+    """
+    Decorator for @st.fragment functions, applied below @st.fragment
+
+    When Streamlit reruns only fragments, the top of the script doesn't run
+    and start_rerun() isn't called, so the fragment gets a profile of its
+    own; during a full rerun it is just a span.
+    """
+    def decorator(func):
+        label = name or f"{func.__module__}.{func.__name__}"
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not PROFILE_ENABLED:
+                return func(*args, **kwargs)
+            with _FragmentSpan(label):
+                return func(*args, **kwargs)
+
+        return wrapper
+    return decorator
+
+def get_session_profiles():
+    """Get this session's most recent finished reruns, oldest first"""
+    session_state = _get_script_session_state()
+    if session_state is None:
+        return []
+    return list(session_state.get("rerun_profiles", []))
+
+def flatten(profile):
+    """List a profile's spans depth-first as rows with an indented name, for display"""
+    rows = []
+    pending = [(node, 0) for node in reversed(profile["spans"])]
+    while pending:
+        node, depth = pending.pop()
+        row = {
+            "span": "  " * depth + node["name"],
+            "start ms": node.get("start_ms"),
+            "ms": node.get("ms"),
+            "% of rerun": round(100 * node.get("ms", 0) / profile["ms"], 1) if profile["ms"] else None
+        }
+        row.update((key, value) for key, value in node.items()
+                   if key not in ("name", "children", "start_ms", "ms"))
+        rows.append(row)
+        pending.extend((child, depth + 1) for child in reversed(node["children"]))
+    return rows
+
+def to_jsonl(profiles):
+    """Serialize profiles as JSON lines, the format of CHALCHITRA_PROFILE_LOG"""
+    return "".join(json.dumps(profile, default=str) + "\n" for profile in profiles)
@@ -1,7 +1,10 @@
 import streamlit as st
+import numpy as np
 from recommendation_engine import get_recommendations
 from movie_data import get_all_genres, get_genre_ids, get_languages, get_language_code
 import database as db
+import catalog
+import feed
 import uuid
 
 # Ensure we have a session ID for the current user
@@ -10,14 +13,82 @@ def ensure_session_id():
         st.session_state.session_id = str(uuid.uuid4())
     return st.session_state.session_id
 
-# Get or create user in database
+# Get or create user in database, once per session
 def get_or_create_user():
+    """Get the signed-in account's id, or else the anonymous user of this session"""
+    if st.session_state.get('is_authenticated') and st.session_state.get('user_id'):
+        return st.session_state.user_id
+    
     session_id = ensure_session_id()
+    # Remember the id with the session_id it belongs to, so later calls are free
+    memoized = st.session_state.get('session_user')
+    if memoized and memoized[0] == session_id:
+        return memoized[1]
+    
     user_id = db.get_or_create_user(session_id)
     if not user_id:
         st.error("Failed to create or retrieve user profile.")
+        return user_id
+    
+    st.session_state.session_user = (session_id, user_id)
     return user_id
 
+# Sessions keep recommendations as ranked tmdb_ids and scores; the movies
+# themselves live once per process in the shared catalog. The ids grow a
+# page of candidates at a time, and rec_feed is the cursor: the next TMDB
+# page to rank and how many recommendations are shown.
+def store_recommendations(movies, scores):
+    st.session_state.recommended_ids = catalog.remember_movies(movies)
+    st.session_state.recommended_scores = np.asarray(scores, dtype=np.float32)
+    st.session_state.rec_feed = {
+        'id': uuid.uuid4().hex,
+        'next_page': 2,
+        'exhausted': False,
+        'visible': feed.FEED_PAGE_SIZE
+    }
+
+def clear_recommendations():
+    st.session_state.recommended_ids = np.empty(0, dtype=np.int64)
+    st.session_state.recommended_scores = np.empty(0, dtype=np.float32)
+    st.session_state.rec_feed = {'id': None, 'next_page': 1, 'exhausted': True, 'visible': feed.FEED_PAGE_SIZE}
+
+def get_session_recommendations():
+    """Get this session's recommended movies, best first"""
+    return catalog.resolve_movies(st.session_state.get('recommended_ids', []))
+
+def _feed_page_args():
+    """The preferences, seen set and listed ids a feed page is ranked against"""
+    user_id = get_or_create_user()
+    seen_ids = db.get_session_seen_movie_ids(user_id) if user_id else None
+    return dict(st.session_state.preferences), seen_ids, st.session_state.recommended_ids
+
+def prefetch_recommendations():
+    """Rank the feed's next page in the background if the next "Show more" would need it"""
+    rec_feed = st.session_state.rec_feed
+    if rec_feed['exhausted'] or len(st.session_state.recommended_ids) >= rec_feed['visible'] + feed.FEED_PAGE_SIZE:
+        return
+    feed.prefetch_page(rec_feed['id'], rec_feed['next_page'], *_feed_page_args())
+
+def show_more_recommendations():
+    """Show another page of recommendations, adding ranked candidate pages as needed"""
+    rec_feed = st.session_state.rec_feed
+    rec_feed['visible'] += feed.FEED_PAGE_SIZE
+    
+    # A page can come back short once seen and listed movies are dropped
+    while not rec_feed['exhausted'] and len(st.session_state.recommended_ids) < rec_feed['visible']:
+        page = feed.take_page(rec_feed['id'], rec_feed['next_page'], *_feed_page_args())
+        if page is None:
+            st.toast("Couldn't load more recommendations. Please try again.")
+            break
+        
+        movies, scores, has_more = page
+        st.session_state.recommended_ids = np.concatenate(
+            [st.session_state.recommended_ids, catalog.remember_movies(movies)])
+        st.session_state.recommended_scores = np.concatenate(
+            [st.session_state.recommended_scores, np.asarray(scores, dtype=np.float32)])
+        rec_feed['next_page'] += 1
+        rec_feed['exhausted'] = not has_more
+
 def display_quiz():
     """Display the 5-question preference quiz"""
     st.header("Tell us what you like")
@@ -150,15 +221,15 @@ def process_quiz_results(genres, year_range, min_rating, languages, movie_length
     st.session_state.quiz_completed = True
     
     # Generate recommendations based on preferences
-    recommendations = get_recommendations(st.session_state.preferences)
+    seen_ids = db.get_session_seen_movie_ids(user_id) if user_id else None
+    recommendations, scores = get_recommendations(st.session_state.preferences, seen_ids, with_scores=True)
     
     # Save recommended movies to database
     if user_id:
-        for movie in recommendations[:20]:  # Limit to first 20 recommendations
-            db.save_movie(movie)
+        db.save_movies(recommendations[:20])  # Limit to first 20 recommendations
     
     # Store recommendations in session state
-    st.session_state.movies_data = recommendations
+    store_recommendations(recommendations, scores)
     
     # Show success message
     st.success("Preferences saved! We've found some movies for you.")
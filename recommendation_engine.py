@@ -1,19 +1,20 @@
-import pandas as pd
 import numpy as np
-from sklearn.metrics.pairwise import cosine_similarity
-from sklearn.preprocessing import MinMaxScaler
-from tmdb_api import get_movies_by_preferences, get_trending_movies
+from tmdb_api import get_movies_by_preferences, get_trending_movies, discover_movies
 import streamlit as st
+import profiler
 
-def get_recommendations(preferences):
+@profiler.timed()
+def get_recommendations(preferences, seen_ids=None, with_scores=False):
     """
     Generate movie recommendations based on user preferences
     
     Parameters:
     preferences (dict): Dictionary containing user preferences from the quiz
+    seen_ids (numpy.ndarray): Sorted tmdb_ids the user already watched or rated
+    with_scores (bool): Also return the ranking scores
     
     Returns:
-    list: List of recommended movies
+    list: List of recommended movies, or (movies, scores) with with_scores
     """
     # Extract preferences
     genres = preferences.get('genres', [])
@@ -34,40 +35,126 @@ def get_recommendations(preferences):
     if len(recommended_movies) < 8:
         trending_movies = get_trending_movies()
         # Filter trending movies by preferences
-        trending_filtered = [
-            movie for movie in trending_movies
-            if (not genres or any(genre_id in movie.get('genre_ids', []) for genre_id in genres)) and
-               (not languages or movie.get('original_language') in languages) and
-               (movie.get('vote_average', 0) >= rating_min)
-        ]
+        trending_filtered = filter_by_preferences(trending_movies, genres, languages, rating_min)
         recommended_movies.extend(trending_filtered)
         
         # Remove duplicates
-        seen_ids = set()
-        unique_recommendations = []
-        for movie in recommended_movies:
-            if movie['id'] not in seen_ids:
-                seen_ids.add(movie['id'])
-                unique_recommendations.append(movie)
-        
-        recommended_movies = unique_recommendations
+        recommended_movies = remove_duplicates(recommended_movies)
     
     # Use content-based filtering to rank the recommendations
-    return rank_recommendations(recommended_movies, preferences)
+    return rank_recommendations(recommended_movies, preferences, seen_ids, with_scores)
+
+def get_recommendation_page(preferences, page, seen_ids=None, listed_ids=None):
+    """
+    Fetch and rank one more page of candidates for the recommendation feed
+    
+    Page 1 is what get_recommendations ranks; later pages extend the feed.
+    Makes no Streamlit calls, so the feed can prefetch pages on worker threads.
+    
+    Parameters:
+    preferences (dict): Dictionary containing user preferences from the quiz
+    page (int): TMDB discover page to rank
+    seen_ids (numpy.ndarray): Sorted tmdb_ids the user already watched or rated
+    listed_ids (numpy.ndarray): tmdb_ids already in the feed
+    
+    Returns:
+    tuple: (ranked movies, float32 scores, whether there are more pages)
+    """
+    year_range = preferences.get('year_range', [1990, 2023])
+    candidates, total_pages = discover_movies(
+        preferences.get('genres', []),
+        [year_range[0], year_range[1]],
+        preferences.get('min_rating', 7.0),
+        preferences.get('languages', ['en']),
+        page
+    )
+    
+    # One sorted array, so a single exclude_seen pass drops both
+    excluded = np.union1d(
+        seen_ids if seen_ids is not None else np.empty(0, dtype=np.int64),
+        listed_ids if listed_ids is not None else np.empty(0, dtype=np.int64)
+    ).astype(np.int64)
+    ranked, scores = rank_recommendations(remove_duplicates(candidates), preferences, excluded, with_scores=True)
+    return ranked, scores, page < total_pages
+
+def filter_by_preferences(movies, genres, languages, rating_min):
+    """Keep only movies matching the preferred genres, languages and minimum rating"""
+    return [
+        movie for movie in movies
+        if (not genres or any(genre_id in movie.get('genre_ids', []) for genre_id in genres)) and
+           (not languages or movie.get('original_language') in languages) and
+           (movie.get('vote_average', 0) >= rating_min)
+    ]
+
+def remove_duplicates(movies):
+    """Remove repeated movies, keeping the first occurrence of each id"""
+    seen_ids = set()
+    unique_movies = []
+    for movie in movies:
+        if movie['id'] not in seen_ids:
+            seen_ids.add(movie['id'])
+            unique_movies.append(movie)
+    return unique_movies
+
+def filter_movies(movies, genre=None, language_code=None):
+    """
+    Apply the sidebar genre and language filters to a list of movies
+    
+    Parameters:
+    movies (list): List of movie dictionaries
+    genre (str): Genre name to keep, or None for all genres
+    language_code (str): ISO 639-1 language code to keep, or None for all languages
+    
+    Returns:
+    list: Filtered list of movies
+    """
+    if genre:
+        movies = [m for m in movies if genre in m.get('genres', [])]
+    
+    if language_code:
+        movies = [m for m in movies if m.get('original_language') == language_code]
+    
+    return movies
 
-def rank_recommendations(movies, preferences):
+def exclude_seen(movies, seen_ids):
+    """
+    Drop movies the user has already seen
+    
+    Parameters:
+    movies (list): List of movie dictionaries
+    seen_ids (numpy.ndarray): Sorted array of seen tmdb_ids
+    
+    Returns:
+    list: Movies whose id is not in seen_ids
+    """
+    if seen_ids is None or len(seen_ids) == 0 or not movies:
+        return movies
+    
+    # Binary-search every id in the sorted seen set at once
+    movie_ids = np.fromiter((movie['id'] for movie in movies), dtype=np.int64, count=len(movies))
+    positions = np.minimum(np.searchsorted(seen_ids, movie_ids), len(seen_ids) - 1)
+    unseen_mask = seen_ids[positions] != movie_ids
+    
+    return [movie for movie, unseen in zip(movies, unseen_mask) if unseen]
+
+@profiler.timed()
+def rank_recommendations(movies, preferences, seen_ids=None, with_scores=False):
     """
     Rank recommendations using a content-based approach
     
     Parameters:
     movies (list): List of movie dictionaries
     preferences (dict): User preferences
+    seen_ids (numpy.ndarray): Sorted tmdb_ids to leave out of the ranking
+    with_scores (bool): Also return the scores, as a float32 array in ranked order
     
     Returns:
-    list: Ranked list of movies
+    list: Ranked list of movies, or (movies, scores) with with_scores
     """
+    movies = exclude_seen(movies, seen_ids)
+    
     if not movies:
-        return []
+        return ([], np.empty(0, dtype=np.float32)) if with_scores else []
     
     # Create a feature matrix for movies
     features = []
@@ -113,17 +200,24 @@ def rank_recommendations(movies, preferences):
     
     # Calculate similarity score
     if features:
-        # Normalize features
-        scaler = MinMaxScaler()
-        features_normalized = scaler.fit_transform(features)
+        # Min-max normalize each feature column, in the same arithmetic order as
+        # sklearn's MinMaxScaler so ties rank the same; constant columns become 0
+        features = np.asarray(features, dtype=np.float64)
+        minimums = features.min(axis=0)
+        spans = features.max(axis=0) - minimums
+        spans[spans == 0] = 1.0
+        scale = 1.0 / spans
+        features_normalized = features * scale - minimums * scale
         
         # Calculate a compound score for each movie
-        scores = [sum(feature) for feature in features_normalized]
+        scores = features_normalized.sum(axis=1).tolist()
         
         # Sort movies by score (descending)
-        movies_with_scores = list(zip(movies, scores))
-        ranked_movies = [movie for movie, _ in sorted(movies_with_scores, key=lambda x: x[1], reverse=True)]
+        movies_with_scores = sorted(zip(movies, scores), key=lambda x: x[1], reverse=True)
+        ranked_movies = [movie for movie, _ in movies_with_scores]
         
+        if with_scores:
+            return ranked_movies, np.array([score for _, score in movies_with_scores], dtype=np.float32)
         return ranked_movies
     
     return movies
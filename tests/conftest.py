@@ -0,0 +1,161 @@
+import os
+import sqlite3
+import tempfile
+import types
+
+# database.py reads DATABASE_URL at import, so point it at a throwaway SQLite file first
+os.environ["DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp(prefix='chalchitra-tests-')}/test.db"
+# The app starts these jobs; in the background they would race the tests that run them directly
+os.environ["WATCH_COMPACTION_INTERVAL"] = "0"
+os.environ["TOKEN_REAPER_INTERVAL"] = "0"
+
+import pytest
+import streamlit.runtime.scriptrunner as scriptrunner
+from sqlalchemy import event, text
+
+import database as db
+from migrations import run_migrations
+
+run_migrations()
+
+# No users row has this id until a test adds it, so writes referencing it break a foreign key
+MISSING_USER_ID = 999999
+
+# Children first, so foreign keys never block the cleanup
+TABLES = [
+    "movie_daily_views", "movie_view_stats", "user_movie_views", "watch_events", "movie_stats",
+    "user_ratings", "user_watched_movies", "user_genre_preferences", "user_preferences",
+    "movie_genres", "movies", "user_auth", "users"
+]
+
+@pytest.fixture(autouse=True)
+def clean_database():
+    """Give every test empty tables and caches"""
+    yield
+    with db.engine.begin() as conn:
+        for table in TABLES:
+            conn.execute(text(f"DELETE FROM {table}"))
+        conn.execute(text("UPDATE compaction_state SET watermark = '1970-01-01 00:00:00'"))
+    with db._user_cache_lock:
+        db._user_cache.clear()
+    with db._token_cache_lock:
+        db._token_cache.clear()
+    db.reset_genre_map()
+
+@pytest.fixture
+def deferred_foreign_keys():
+    """Check foreign keys at COMMIT instead of per statement, so the commit itself fails"""
+    def defer(conn):
+        conn.connection.driver_connection.execute("PRAGMA defer_foreign_keys=ON")
+
+    event.listen(db.engine, "begin", defer)
+    yield
+    event.remove(db.engine, "begin", defer)
+
+@pytest.fixture
+def replica(tmp_path, monkeypatch):
+    """A read replica that only catches up with the primary when the test calls it"""
+    path = tmp_path / "replica.db"
+
+    def catch_up():
+        source = sqlite3.connect(db.engine.url.database)
+        target = sqlite3.connect(path)
+        source.backup(target)
+        target.close()
+        source.close()
+
+    catch_up()
+    replica_engine = db.backend.create_engine(f"sqlite:///{path}")
+    monkeypatch.setattr(db, "replica_engines", [replica_engine])
+    monkeypatch.setattr(db, "_replica_down_until", {})
+    yield catch_up
+    replica_engine.dispose()
+
+class SessionState(dict):
+    """Dict-backed stand-in for st.session_state"""
+    __getattr__ = dict.__getitem__
+    __setattr__ = dict.__setitem__
+
+@pytest.fixture
+def script_run(monkeypatch):
+    """Pretend to be inside a script run; set ctx.fragment_ids_this_run to simulate a fragment-only rerun"""
+    ctx = types.SimpleNamespace(fragment_ids_this_run=None)
+    monkeypatch.setattr(scriptrunner, "get_script_run_ctx", lambda: ctx)
+    monkeypatch.setattr(db.st, "session_state", SessionState())
+    return ctx
+
+@pytest.fixture(scope="session")
+def tmdb_stand_in():
+    """The load test's local TMDB server, with a small synthetic catalog"""
+    from loadtest import TmdbStandIn
+
+    stand_in = TmdbStandIn(movie_count=500).start()
+    yield stand_in
+    stand_in.stop()
+
+@pytest.fixture
+def tmdb(tmdb_stand_in, monkeypatch):
+    """Point the TMDB clients at the stand-in"""
+    import movie_data
+    import tmdb_api
+
+    # The app modules are already imported, so patch what they read at import time
+    for module in (tmdb_api, movie_data):
+        monkeypatch.setattr(module, "TMDB_BASE_URL", tmdb_stand_in.base_url)
+        monkeypatch.setattr(module, "TMDB_API_KEY", "test")
+    return tmdb_stand_in
+
+@pytest.fixture
+def app(tmdb):
+    """A logged-in session of app.py, not yet run, with TMDB served by the stand-in"""
+    import write_queue
+    from streamlit.testing.v1 import AppTest
+
+    user_id = make_user()
+    _, auth_token = db.authenticate_user("user", "password")
+    app_test = AppTest.from_file(os.path.join(os.path.dirname(__file__), "..", "app.py"), default_timeout=60)
+    app_test.session_state["is_authenticated"] = True
+    app_test.session_state["user_id"] = user_id
+    app_test.session_state["username"] = "user"
+    app_test.session_state["auth_token"] = auth_token
+    yield app_test
+    # Write what the session queued before the tables are cleaned
+    write_queue.flush_pending()
+
+def take_quiz(app_test, genre="Drama"):
+    """Run the app and answer the preference quiz, landing on the home tabs"""
+    app_test.run()
+    next(widget for widget in app_test.multiselect if widget.label == "Select up to 3 genres").set_value([genre])
+    next(widget for widget in app_test.button if widget.label == "Get Recommendations").click().run()
+    assert not app_test.exception
+    assert len(app_test.session_state["recommended_ids"])
+
+def open_tab(app_test, label):
+    """Switch the home tabs the way a click does, with a full rerun"""
+    app_test.session_state["home_tab"] = label
+    app_test.run()
+    assert not app_test.exception
+
+def make_movie(tmdb_id, **fields):
+    """A movie dict shaped like the TMDB list results"""
+    movie = {
+        'id': tmdb_id,
+        'title': f"Movie {tmdb_id}",
+        'release_date': "2020-01-01",
+        'poster_path': None,
+        'vote_average': 7.0,
+        'overview': "",
+        'genre_ids': [28],
+        'original_language': "en"
+    }
+    movie.update(fields)
+    return movie
+
+def make_user(username="user"):
+    user_id, error = db.create_user_account(username, "password")
+    assert error is None
+    return user_id
+
+def add_missing_user():
+    """Create the user MISSING_USER_ID refers to, so writes for it start to succeed"""
+    db.execute_query("INSERT INTO users (id, session_id) VALUES (:id, 'late')", {"id": MISSING_USER_ID})
@@ -0,0 +1,68 @@
+import datetime
+
+import database as db
+import write_queue
+from loadtest import _find_grid, click_grid
+from tests.conftest import make_movie, open_tab, take_quiz
+
+def watch_counts(user_id):
+    return db.fetch_all("""
+        SELECT m.tmdb_id, COUNT(*) FROM watch_events e JOIN movies m ON m.id = e.movie_id
+        WHERE e.user_id = :user_id GROUP BY m.tmdb_id
+    """, {"user_id": user_id})
+
+def test_poster_click_records_the_view_and_opens_details(app):
+    take_quiz(app)
+    open_tab(app, "Similar Movies")
+    _, movie_ids = _find_grid(app, "sim_grid")
+
+    click_grid(app, "sim_grid", movie_ids[0])
+
+    assert not app.exception
+    assert app.query_params["view"] == "details"
+    assert app.query_params["movie_id"] == str(movie_ids[0])
+    write_queue.flush_pending()
+    assert [tuple(row) for row in watch_counts(app.session_state["user_id"])] == [(movie_ids[0], 1)]
+
+def test_history_grids_do_not_record_views(app):
+    user_id = app.session_state["user_id"]
+    db.save_user_ratings([(user_id, make_movie(7), 6)])
+    take_quiz(app)
+    open_tab(app, "Your History")
+
+    click_grid(app, "rated_grid", 7)
+
+    assert app.query_params["view"] == "details"
+    write_queue.flush_pending()
+    assert watch_counts(user_id) == []
+
+def test_rating_section_queues_the_rating(app):
+    take_quiz(app)
+    open_tab(app, "Similar Movies")
+    _, movie_ids = _find_grid(app, "sim_grid")
+    click_grid(app, "sim_grid", movie_ids[0])
+
+    next(slider for slider in app.slider if slider.label == "Your rating").set_value(3)
+    app.button(key=f"rate_btn_{movie_ids[0]}").click().run()
+
+    assert app.success[0].value == "Thanks for rating this movie 3/10!"
+    write_queue.flush_pending()
+    assert db.fetch_one("SELECT rating FROM user_ratings WHERE user_id = :user_id",
+                        {"user_id": app.session_state["user_id"]})[0] == 3
+
+def test_history_panel_loads_more_watched_movies(app):
+    user_id = app.session_state["user_id"]
+    earlier = db.utcnow() - datetime.timedelta(hours=1)
+    db.save_watched_movies([(user_id, make_movie(tmdb_id), earlier) for tmdb_id in range(1, 26)])
+    db.compact_watch_events(lag_seconds=0)
+    take_quiz(app)
+    open_tab(app, "Your History")
+    _, first_page = _find_grid(app, "watched_grid")
+
+    app.button(key="more_watched").click().run()
+    # AppTest doesn't replay the button's st.rerun(scope="fragment"), which redraws the grid above it
+    app.run()
+
+    _, both_pages = _find_grid(app, "watched_grid")
+    assert app.session_state["history_pages"]["watched"] == 2
+    assert (len(first_page), len(both_pages)) == (20, 25)
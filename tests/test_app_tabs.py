@@ -0,0 +1,46 @@
+import time
+
+import database as db
+from tests.conftest import open_tab, take_quiz
+
+def headers(app_test):
+    return [header.value for header in app_test.header]
+
+def test_only_the_open_tab_runs(app):
+    take_quiz(app)
+
+    assert "Recommended For You" in headers(app)
+    assert "Trending Movies" not in headers(app)
+    # None of the other tabs' loaders have run
+    assert app.session_state["tab_data"] == {}
+
+def test_tab_loads_on_first_open_and_is_reused(app, tmdb_stand_in):
+    take_quiz(app)
+
+    open_tab(app, "Trending")
+    assert "Trending Movies" in headers(app)
+    assert list(app.session_state["tab_data"]) == ["trending"]
+    trending = app.session_state["tab_data"]["trending"]
+
+    open_tab(app, "Your History")
+    open_tab(app, "Trending")
+    requests = tmdb_stand_in.requests
+    open_tab(app, "Trending")
+
+    assert app.session_state["tab_data"]["trending"] is trending
+    assert tmdb_stand_in.requests == requests
+    assert sorted(app.session_state["tab_data"]) == ["history", "trending"]
+
+def test_history_tab_reloads_after_a_write(app):
+    take_quiz(app)
+    open_tab(app, "Your History")
+    assert not any("Your Watch History" in subheader.value for subheader in app.subheader)
+
+    user_id = app.session_state["user_id"]
+    tmdb_id = int(app.session_state["recommended_ids"][0])
+    db.save_watched_movies([(user_id, {'id': tmdb_id, 'title': "Watched", 'genre_ids': []})])
+    # A write by this session moves db_last_write_at, which keys the cached tab
+    app.session_state["db_last_write_at"] = time.monotonic()
+    app.run()
+
+    assert any("Your Watch History" in subheader.value for subheader in app.subheader)
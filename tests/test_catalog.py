@@ -0,0 +1,57 @@
+import database as db
+import tmdb_api
+from catalog import MovieCatalog
+from tests.conftest import make_movie
+
+def test_put_returns_the_ids_in_order():
+    catalog = MovieCatalog(max_movies=10)
+
+    assert catalog.put([make_movie(3), make_movie(1), make_movie(2)]).tolist() == [3, 1, 2]
+
+def test_cached_movies_are_hits():
+    catalog = MovieCatalog(max_movies=10)
+    catalog.put([make_movie(1), make_movie(2)])
+
+    assert [movie['id'] for movie in catalog.get([2, 1, 2])] == [2, 1, 2]
+
+    stats = catalog.get_stats()
+    assert (stats["hits"], stats["misses"]) == (3, 0)
+
+def test_least_recently_used_movie_is_evicted():
+    catalog = MovieCatalog(max_movies=2)
+    catalog.put([make_movie(1), make_movie(2)])
+    catalog.get([1])
+    catalog.put([make_movie(3)])
+
+    stats = catalog.get_stats()
+    assert (stats["size"], stats["evicted"]) == (2, 1)
+    assert list(catalog._movies) == [1, 3]
+
+def test_evicted_saved_movie_reloads_from_the_database():
+    db.save_movies([make_movie(1, title="Saved")])
+    catalog = MovieCatalog(max_movies=1)
+    catalog.put([make_movie(1, title="Saved"), make_movie(2)])
+
+    assert [movie['title'] for movie in catalog.get([1])] == ["Saved"]
+
+    stats = catalog.get_stats()
+    assert (stats["misses"], stats["loaded"], stats["fetched"]) == (1, 1, 0)
+    assert catalog.get([1]) and catalog.get_stats()["hits"] == 1
+
+def test_evicted_unsaved_movie_is_fetched_and_slimmed(monkeypatch):
+    details = dict(make_movie(2), cast=[{'name': "Someone"}], trailer="abc", budget=1)
+    monkeypatch.setattr(tmdb_api, "get_movie_details", lambda tmdb_id: details if tmdb_id == 2 else None)
+    catalog = MovieCatalog(max_movies=10)
+
+    movies = catalog.get([2, 404])
+
+    assert [movie['id'] for movie in movies] == [2]
+    assert "cast" not in movies[0] and "trailer" not in movies[0]
+    assert "cast" not in catalog._movies[2]
+    assert catalog.get_stats()["fetched"] == 1
+
+def test_only_list_fields_are_kept():
+    catalog = MovieCatalog(max_movies=10)
+    catalog.put([make_movie(1, popularity=12.5, production_companies=["Studio"])])
+
+    assert set(catalog.get([1])[0]) == set(make_movie(1))
@@ -0,0 +1,96 @@
+import threading
+
+import numpy as np
+import pytest
+
+import feed
+from feed import FeedPrefetcher
+from tests.conftest import make_movie
+
+PREFERENCES = {'genres': [28], 'year_range': [2000, 2020], 'min_rating': 6.0, 'languages': ['en']}
+
+class FakeRecommender:
+    """Stands in for the TMDB-backed get_recommendation_page; page n holds movies n*10 .. n*10+2"""
+    def __init__(self):
+        self.calls = []
+        # Cleared to hold the prefetch threads, like a slow TMDB
+        self.release = threading.Event()
+        self.release.set()
+
+    def __call__(self, preferences, page, seen_ids=None, listed_ids=None):
+        self.calls.append(page)
+        if threading.current_thread().name.startswith("feed-prefetch"):
+            self.release.wait()
+        movies = [make_movie(page * 10 + n) for n in range(3)]
+        return movies, np.array([0.9, 0.8, 0.7]), True
+
+@pytest.fixture
+def recommender(monkeypatch):
+    fake = FakeRecommender()
+    monkeypatch.setattr(feed, "get_recommendation_page", fake)
+    yield fake
+    fake.release.set()
+
+@pytest.fixture
+def prefetcher():
+    prefetcher = FeedPrefetcher(workers=2, max_pages=10, take_timeout=5)
+    yield prefetcher
+    prefetcher.stop()
+
+def ids(page_result):
+    return [movie['id'] for movie in page_result[0]]
+
+def test_prefetched_page_is_taken_without_recomputing(recommender, prefetcher):
+    prefetcher.prefetch("feed", 2, PREFERENCES)
+    prefetcher._pages[("feed", 2)].result()
+
+    assert ids(prefetcher.take("feed", 2, PREFERENCES)) == [20, 21, 22]
+    assert recommender.calls == [2]
+    stats = prefetcher.get_stats()
+    assert (stats["ready"], stats["computed"], stats["pending"]) == (1, 0, 0)
+
+def test_page_not_prefetched_is_computed(recommender, prefetcher):
+    assert ids(prefetcher.take("feed", 1, PREFERENCES)) == [10, 11, 12]
+    assert prefetcher.get_stats()["computed"] == 1
+
+def test_slow_prefetch_times_out_and_the_page_is_computed(recommender, prefetcher):
+    prefetcher.take_timeout = 0.05
+    recommender.release.clear()
+    prefetcher.prefetch("feed", 1, PREFERENCES)
+
+    result = prefetcher.take("feed", 1, PREFERENCES)
+
+    assert ids(result) == [10, 11, 12]
+    stats = prefetcher.get_stats()
+    assert (stats["waited"], stats["timed_out"]) == (1, 1)
+    assert recommender.calls == [1, 1]
+
+def test_movies_seen_since_the_prefetch_are_dropped(recommender, prefetcher):
+    prefetcher.prefetch("feed", 1, PREFERENCES)
+
+    movies, scores, has_more = prefetcher.take("feed", 1, PREFERENCES, seen_ids=np.array([11], dtype=np.int64))
+
+    assert [movie['id'] for movie in movies] == [10, 12]
+    assert scores.tolist() == [0.9, 0.7]
+    assert has_more
+
+def test_failed_page_returns_none(monkeypatch, prefetcher):
+    def failing(*args):
+        raise RuntimeError("TMDB is down")
+
+    monkeypatch.setattr(feed, "get_recommendation_page", failing)
+
+    assert prefetcher.take("feed", 1, PREFERENCES) is None
+    assert prefetcher.get_stats()["failed"] == 1
+
+def test_oldest_prefetch_is_evicted(recommender):
+    prefetcher = FeedPrefetcher(workers=1, max_pages=1)
+    try:
+        prefetcher.prefetch("a", 1, PREFERENCES)
+        prefetcher.prefetch("b", 1, PREFERENCES)
+
+        stats = prefetcher.get_stats()
+        assert (stats["prefetched"], stats["evicted"], stats["pending"]) == (2, 1, 1)
+        assert ("b", 1) in prefetcher._pages
+    finally:
+        prefetcher.stop()
@@ -0,0 +1,70 @@
+import pytest
+
+import database as db
+from tests.conftest import make_movie, make_user
+
+@pytest.fixture
+def test_genres():
+    """Remove the genres a test adds, which the shared cleanup leaves alone"""
+    yield
+    db.execute_query("DELETE FROM movie_genres")
+    db.execute_query("DELETE FROM user_genre_preferences")
+    db.execute_query("DELETE FROM genres WHERE name LIKE 'Test %'")
+    db.reset_genre_map()
+
+def genre_id(tmdb_id):
+    return db.fetch_one("SELECT id FROM genres WHERE tmdb_id = :tmdb_id", {"tmdb_id": tmdb_id})[0]
+
+def test_map_is_loaded_once():
+    genre_map = db.get_genre_map()
+
+    assert db.get_genre_map() is genre_map
+    assert genre_map["by_tmdb_id"][28] == genre_id(28)
+    assert genre_map["tmdb_by_id"][genre_id(28)] == 28
+
+def test_unknown_genres_are_left_out():
+    assert db.resolve_genre_ids([28, 987654, 35]) == [genre_id(28), genre_id(35)]
+
+def test_genre_saved_here_is_resolved_at_once(test_genres):
+    db.get_genre_map()
+
+    db.save_genre_mapping(987001, "Test Noir")
+
+    assert db.resolve_genre_ids([987001]) == [genre_id(987001)]
+
+def test_genre_added_elsewhere_is_found_on_a_miss(test_genres, monkeypatch):
+    db.get_genre_map()
+    # Bypasses save_genre_mapping, like another server process
+    db.execute_query("INSERT INTO genres (tmdb_id, name) VALUES (987002, 'Test Elsewhere')")
+
+    assert db.resolve_genre_ids([987002]) == []
+
+    monkeypatch.setattr(db, "GENRE_MAP_MISS_RELOAD_SECONDS", 0)
+    assert db.resolve_genre_ids([987002]) == [genre_id(987002)]
+
+def test_preference_genres_use_the_resolved_ids():
+    user_id = make_user()
+    prefs = {'genres': [28, 35, 987654], 'year_range': [2000, 2020], 'min_rating': 6.0, 'languages': ['en']}
+
+    assert db.save_user_preferences(user_id, prefs)
+
+    assert sorted(db.get_user_preferences(user_id)['genres']) == [28, 35]
+
+def test_movie_genre_names_are_created_and_linked(test_genres):
+    db.save_movies([make_movie(1, genres=["Test Western", "Action"]), make_movie(2, genre_ids=[35])])
+
+    links = db.fetch_all("""
+        SELECT m.tmdb_id, g.name FROM movie_genres mg
+        JOIN movies m ON m.id = mg.movie_id JOIN genres g ON g.id = mg.genre_id
+        ORDER BY m.tmdb_id, g.name
+    """)
+    assert [tuple(row) for row in links] == [(1, "Action"), (1, "Test Western"), (2, "Comedy")]
+    assert "Test Western" in db.get_genre_map()["by_name"]
+
+def test_rolled_back_genre_is_not_cached(test_genres):
+    with db.transaction():
+        db.save_movies([make_movie(1, genres=["Test Rollback"])])
+        db.execute_query("INSERT INTO no_such_table VALUES (1)")
+
+    assert db.get_last_transaction_error() is not None
+    assert "Test Rollback" not in db.get_genre_map()["by_name"]
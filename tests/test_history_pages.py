@@ -0,0 +1,39 @@
+import database as db
+from tests.conftest import make_movie, make_user
+
+def rating_pages(user_id, limit):
+    pages, cursor = [], None
+    while True:
+        rows, cursor = db.get_user_movie_ratings_page(user_id, limit, cursor)
+        pages.append([row[0] for row in rows])
+        if cursor is None:
+            return pages
+
+def test_ratings_with_tied_timestamps_page_without_gaps_or_repeats():
+    user_id = make_user()
+    # One statement, so every row gets the same created_at
+    db.save_user_ratings([(user_id, make_movie(tmdb_id), 3) for tmdb_id in range(1, 6)])
+
+    pages = rating_pages(user_id, 2)
+
+    assert [len(page) for page in pages] == [2, 2, 1]
+    assert sorted(sum(pages, [])) == [1, 2, 3, 4, 5]
+
+def test_full_last_page_has_no_cursor():
+    user_id = make_user()
+    db.save_user_ratings([(user_id, make_movie(tmdb_id), 3) for tmdb_id in range(1, 5)])
+
+    pages = rating_pages(user_id, 2)
+
+    # No trailing empty page is needed to find the end
+    assert [len(page) for page in pages] == [2, 2]
+
+def test_no_ratings_is_one_empty_page():
+    assert db.get_user_movie_ratings_page(make_user(), 10, None) == ([], None)
+
+def test_page_after_the_last_row_is_empty():
+    user_id = make_user()
+    db.save_user_ratings([(user_id, make_movie(1), 3)])
+    last = db.fetch_one("SELECT created_at, id FROM user_ratings")
+
+    assert db.get_user_movie_ratings_page(user_id, 10, tuple(last)) == ([], None)
@@ -0,0 +1,53 @@
+import random
+
+import pytest
+
+import database as db
+import loadtest
+import write_queue
+
+def test_percentile_is_nearest_rank():
+    values = [5, 1, 4, 2, 3]
+
+    assert loadtest.percentile(values, 0.0) == 1
+    assert loadtest.percentile(values, 0.5) == 3
+    assert loadtest.percentile(values, 0.99) == 5
+
+def test_stand_in_filters_discover_like_tmdb(tmdb_stand_in):
+    status, body = tmdb_stand_in.respond("/discover/movie", {
+        'with_genres': ['18'], 'vote_average.gte': ['6'], 'page': ['2']
+    })
+
+    assert status == 200 and body['page'] == 2
+    assert len(body['results']) <= loadtest.PAGE_SIZE
+    assert all(18 in movie['genre_ids'] and movie['vote_average'] >= 6 for movie in body['results'])
+
+def test_stand_in_serves_details_and_similar(tmdb_stand_in):
+    movie_id = tmdb_stand_in.movies[0]['id']
+
+    status, details = tmdb_stand_in.respond(f"/movie/{movie_id}", {})
+    assert status == 200
+    assert details['credits']['crew'][0]['job'] == "Director"
+
+    _, similar = tmdb_stand_in.respond(f"/movie/{movie_id}/similar", {})
+    assert movie_id not in [movie['id'] for movie in similar['results']]
+
+    assert tmdb_stand_in.respond("/movie/0", {})[0] == 404
+
+def test_journey_runs_every_step(tmdb):
+    db.create_user_account("journey", loadtest.PASSWORD)
+    timings = {}
+
+    loadtest.run_journey("journey", random.Random(1), lambda step, seconds: timings.setdefault(step, seconds))
+
+    assert list(timings) == loadtest.STEPS
+    assert tmdb.requests > 0
+    write_queue.flush_pending()
+    assert db.fetch_one("SELECT COUNT(*) FROM user_ratings")[0] == 1
+
+def test_journey_reports_the_failed_step(tmdb):
+    # No account, so the login step fails
+    with pytest.raises(loadtest.JourneyError) as failure:
+        loadtest.run_journey("nobody", random.Random(1), lambda step, seconds: None)
+
+    assert failure.value.step == "login"
@@ -0,0 +1,75 @@
+import threading
+
+import database as db
+from tests.conftest import make_movie, make_user
+
+def stats(tmdb_id):
+    row = db.fetch_one("""
+        SELECT s.rating_count, s.rating_sum, s.avg_rating
+        FROM movie_stats s JOIN movies m ON m.id = s.movie_id
+        WHERE m.tmdb_id = :tmdb_id
+    """, {"tmdb_id": tmdb_id})
+    return tuple(row) if row else None
+
+def all_stats():
+    return sorted(tuple(row) for row in db.fetch_all(
+        "SELECT movie_id, rating_count, rating_sum FROM movie_stats WHERE rating_count > 0"
+    ))
+
+def test_first_rating_adds_to_the_count():
+    user_id = make_user()
+    assert db.save_user_ratings([(user_id, make_movie(1), 4)])
+
+    assert stats(1) == (1, 4, 4.0)
+
+def test_changed_rating_applies_only_the_difference():
+    user_id = make_user()
+    db.save_user_ratings([(user_id, make_movie(1), 4)])
+    db.save_user_ratings([(user_id, make_movie(1), 2)])
+
+    assert stats(1) == (1, 2, 2.0)
+
+def test_ratings_by_several_users_in_one_batch():
+    alice, bob = make_user("alice"), make_user("bob")
+    db.save_user_ratings([(alice, make_movie(1), 5)])
+
+    db.save_user_ratings([
+        (alice, make_movie(1), 3),
+        (bob, make_movie(1), 4),
+        (bob, make_movie(2), 1),
+        # A later rating of the same movie in a batch replaces the earlier one
+        (bob, make_movie(2), 2)
+    ])
+
+    assert stats(1) == (2, 7, 3.5)
+    assert stats(2) == (1, 2, 2.0)
+
+def test_deltas_match_a_rebuild():
+    alice, bob = make_user("alice"), make_user("bob")
+    db.save_user_ratings([(alice, make_movie(1), 5), (bob, make_movie(1), 1), (alice, make_movie(2), 3)])
+    db.save_user_ratings([(bob, make_movie(1), 4), (bob, make_movie(2), 3)])
+    incremental = all_stats()
+
+    assert db.rebuild_movie_stats() == 2
+    assert all_stats() == incremental
+
+def test_rating_changed_twice_in_one_batch():
+    user_id = make_user()
+    db.save_user_ratings([(user_id, make_movie(1), 5)])
+
+    assert db.save_user_ratings([(user_id, make_movie(1), 4), (user_id, make_movie(1), 2)])
+
+    assert stats(1) == (1, 2, 2.0)
+
+def test_concurrent_first_ratings_are_each_counted_once():
+    users = [make_user(f"user{n}") for n in range(8)]
+    threads = [
+        threading.Thread(target=db.save_user_ratings, args=([(user_id, make_movie(1), 3)],))
+        for user_id in users
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert stats(1) == (8, 24, 3.0)
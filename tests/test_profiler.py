@@ -0,0 +1,128 @@
+import json
+
+import pytest
+
+import database as db
+import profiler
+
+@pytest.fixture
+def profiling(monkeypatch):
+    monkeypatch.setattr(profiler, "PROFILE_ENABLED", True)
+    yield
+    profiler._local.profile = None
+
+def names(nodes):
+    return [node["name"] for node in nodes]
+
+def test_spans_build_a_tree_with_totals(profiling):
+    profiler.start_rerun()
+    profiler.annotate(view="home")
+    with profiler.span("load", page=1):
+        with profiler.span("fetch"):
+            pass
+        for _ in range(3):
+            with profiler.timer("score"):
+                pass
+    profile = profiler.finish_rerun()
+
+    assert profile["view"] == "home"
+    assert names(profile["spans"]) == ["load"]
+    load = profile["spans"][0]
+    assert load["page"] == 1
+    # Timers add to the totals without becoming nodes
+    assert names(load["children"]) == ["fetch"]
+    assert profile["timers"]["score"]["count"] == 3
+    assert set(profile["timers"]) == {"load", "fetch", "score"}
+
+def test_failed_span_records_the_error(profiling):
+    profiler.start_rerun()
+    with pytest.raises(ValueError):
+        with profiler.span("parse"):
+            raise ValueError("bad")
+    profile = profiler.finish_rerun()
+
+    assert profile["spans"][0]["error"] == "ValueError"
+
+def test_database_statements_are_recorded(profiling):
+    profiler.start_rerun()
+
+    @profiler.timed("helper")
+    def helper():
+        return db.fetch_all("SELECT 1")
+
+    helper()
+    profile = profiler.finish_rerun()
+
+    helper_span = profile["spans"][0]
+    assert helper_span["name"] == "helper"
+    assert names(helper_span["children"]) == ["db.query"]
+    assert helper_span["children"][0]["caller"]
+
+def test_spans_past_the_limit_only_count_in_the_totals(profiling, monkeypatch):
+    monkeypatch.setattr(profiler, "MAX_PROFILE_SPANS", 2)
+    profiler.start_rerun()
+    for _ in range(4):
+        with profiler.span("step"):
+            pass
+    profile = profiler.finish_rerun()
+
+    assert len(profile["spans"]) == 2
+    assert profile["dropped_spans"] == 2
+    assert profile["timers"]["step"]["count"] == 4
+
+def test_nothing_is_recorded_when_off():
+    assert profiler.span("load") is profiler._NO_SPAN
+    profiler.start_rerun()
+    assert profiler.finish_rerun() is None
+
+def test_unfinished_rerun_is_kept_as_interrupted(profiling, script_run):
+    profiler.start_rerun()
+    with profiler.span("before st.rerun"):
+        pass
+    profiler.start_rerun()
+    profiler.finish_rerun()
+
+    profiles = profiler.get_session_profiles()
+    assert [profile["interrupted"] for profile in profiles] == [True, False]
+    assert names(profiles[0]["spans"]) == ["before st.rerun"]
+
+def test_fragment_is_a_span_of_a_full_rerun(profiling, script_run):
+    @profiler.fragment("grid")
+    def grid():
+        with profiler.span("render"):
+            pass
+
+    profiler.start_rerun()
+    grid()
+    profile = profiler.finish_rerun()
+
+    assert names(profile["spans"]) == ["grid"]
+    assert names(profile["spans"][0]["children"]) == ["render"]
+
+def test_fragment_only_rerun_gets_its_own_profile(profiling, script_run):
+    @profiler.fragment("grid")
+    def grid():
+        with profiler.span("render"):
+            pass
+
+    script_run.fragment_ids_this_run = ["grid-id"]
+    grid()
+
+    (profile,) = profiler.get_session_profiles()
+    assert (profile["name"], profile["fragment"], profile["interrupted"]) == ("grid", True, False)
+    assert names(profile["spans"]) == ["render"]
+
+def test_flatten_and_jsonl_export(profiling):
+    profiler.start_rerun()
+    with profiler.span("outer"):
+        with profiler.span("inner", rows=2):
+            pass
+    profile = profiler.finish_rerun()
+
+    rows = profiler.flatten(profile)
+    assert [row["span"] for row in rows] == ["outer", "  inner"]
+    assert rows[1]["rows"] == 2
+
+    lines = profiler.to_jsonl([profile, profile]).splitlines()
+    assert len(lines) == 2
+    assert json.loads(lines[0]) == json.loads(json.dumps(profile))
@@ -0,0 +1,31 @@
+import database as db
+
+def test_unknown_row_counts_are_not_counted(script_run):
+    db.start_query_stats_rerun()
+    db.fetch_all("SELECT 1")
+    db.execute_query("INSERT INTO users (session_id) VALUES ('a'), ('b')")
+
+    stats = db.get_query_stats()["rerun"]
+    rows = {query["statement"].split()[0]: query["rows"] for query in stats["queries"]}
+    # sqlite3 doesn't report a row count for SELECTs
+    assert rows["SELECT"] is None
+    assert rows["INSERT"] == 2
+    assert stats["rows"] == 2
+
+def test_fragment_only_reruns_start_their_own_stats(script_run):
+    db.start_query_stats_rerun()
+    db.fetch_all("SELECT 1")
+
+    script_run.fragment_ids_this_run = ["grid"]
+    db.fetch_all("SELECT 2")
+    db.fetch_all("SELECT 3")
+    stats = db.get_query_stats()
+    assert (stats["rerun"]["count"], stats["session"]["count"], stats["reruns"]) == (2, 3, 2)
+
+    script_run.fragment_ids_this_run = ["grid"]
+    db.fetch_all("SELECT 4")
+    assert (db.get_query_stats()["rerun"]["count"], db.get_query_stats()["reruns"]) == (1, 3)
+
+    script_run.fragment_ids_this_run = None
+    db.start_query_stats_rerun()
+    assert (db.get_query_stats()["rerun"]["count"], db.get_query_stats()["reruns"]) == (0, 4)
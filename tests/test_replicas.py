@@ -0,0 +1,61 @@
+import time
+
+import database as db
+from tests.conftest import make_user
+
+def count_users():
+    return db.fetch_one("SELECT COUNT(*) FROM users")[0]
+
+def replica_count_users():
+    with db.replica_reads():
+        return count_users()
+
+def test_replica_reads_go_to_the_replica(replica):
+    make_user()
+
+    assert replica_count_users() == 0
+    assert count_users() == 1
+
+    replica()
+    assert replica_count_users() == 1
+
+def test_writes_go_to_the_primary(replica):
+    with db.replica_reads():
+        make_user()
+
+    assert count_users() == 1
+    assert replica_count_users() == 0
+
+def test_reads_inside_a_transaction_stay_on_the_primary(replica):
+    with db.transaction():
+        make_user()
+        assert replica_count_users() == 1
+
+def test_session_reads_its_own_writes(replica, script_run):
+    make_user()
+
+    assert db.get_replica_status()["sticky"]
+    assert replica_count_users() == 1
+
+    db.st.session_state.db_last_write_at = time.monotonic() - db.DB_REPLICA_STICKY_SECONDS
+    assert not db.get_replica_status()["sticky"]
+    assert replica_count_users() == 0
+
+def test_unreachable_replica_falls_back_to_the_primary(tmp_path, monkeypatch):
+    # The replica's directory doesn't exist, so connecting to it fails
+    unreachable = db.backend.create_engine(f"sqlite:///{tmp_path}/missing/replica.db")
+    monkeypatch.setattr(db, "replica_engines", [unreachable])
+    monkeypatch.setattr(db, "_replica_down_until", {})
+    make_user()
+
+    assert replica_count_users() == 1
+    assert db.get_last_transaction_error() is None
+    assert db.get_replica_status() == {"replicas": 1, "healthy": 0, "sticky": False}
+
+def test_token_missing_on_the_replica_is_found_on_the_primary(replica):
+    make_user()
+    user_id, auth_token = db.authenticate_user("user", "password")
+    with db._token_cache_lock:
+        db._token_cache.clear()
+
+    assert db.validate_token(auth_token) == (user_id, "user")
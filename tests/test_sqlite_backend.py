@@ -0,0 +1,111 @@
+import datetime
+import sqlite3
+
+import pytest
+from sqlalchemy import text
+
+import database as db
+from tests.conftest import make_movie, make_user
+
+def other_connection():
+    """A second connection to the test database that gives up on a lock at once"""
+    return sqlite3.connect(db.engine.url.database, timeout=0, isolation_level=None)
+
+def test_connections_use_wal():
+    with db.engine.connect() as conn:
+        assert conn.execute(text("PRAGMA journal_mode")).scalar() == "wal"
+        assert conn.execute(text("PRAGMA foreign_keys")).scalar() == 1
+
+def test_write_transaction_takes_the_write_lock_up_front():
+    other = other_connection()
+    try:
+        with db.transaction():
+            # Nothing written yet, but BEGIN IMMEDIATE already holds the lock
+            with pytest.raises(sqlite3.OperationalError, match="locked"):
+                other.execute("BEGIN IMMEDIATE")
+            # WAL still lets readers in
+            assert other.execute("SELECT COUNT(*) FROM users").fetchone() == (0,)
+    finally:
+        other.close()
+
+def test_read_only_transaction_does_not_block_writers():
+    other = other_connection()
+    try:
+        with db.transaction(read_only=True):
+            db.fetch_all("SELECT id FROM users")
+            other.execute("BEGIN IMMEDIATE")
+            other.execute("INSERT INTO users (session_id) VALUES ('a')")
+            other.execute("COMMIT")
+    finally:
+        other.close()
+
+    assert db.fetch_one("SELECT COUNT(*) FROM users")[0] == 1
+
+def test_arrays_round_trip_as_json():
+    user_id = make_user()
+    prefs = {'genres': [], 'year_range': [2000, 2020], 'min_rating': 6.0,
+             'languages': ['en', 'hi'], 'runtime_range': [90, 150]}
+    assert db.save_user_preferences(user_id, prefs)
+
+    stored = db.fetch_one(
+        "SELECT preferred_languages, runtime_range FROM user_preferences WHERE user_id = :user_id",
+        {"user_id": user_id}
+    )
+    assert tuple(stored) == ('["en", "hi"]', '[90, 150]')
+
+    loaded = db.get_user_preferences(user_id)
+    assert loaded['languages'] == ['en', 'hi']
+    assert loaded['runtime_range'] == [90, 150]
+
+def test_empty_and_missing_arrays():
+    assert db.backend.encode_array([]) == "[]"
+    assert db.backend.decode_array("[]") == []
+    assert db.backend.encode_array(None) is None
+    assert db.backend.decode_array(None) is None
+
+def test_explain_shows_the_query_plan():
+    with db.engine.connect() as conn:
+        cursor = conn.connection.driver_connection.cursor()
+        plan = db.backend.explain(cursor, "SELECT id FROM movies WHERE tmdb_id = ?", (1,))
+        cursor.close()
+
+    assert "movies" in plan
+    assert plan.startswith(("SEARCH", "SCAN"))
+
+def test_explain_failure_is_reported_not_raised():
+    with db.engine.connect() as conn:
+        cursor = conn.connection.driver_connection.cursor()
+        plan = db._explain(cursor, "SELECT id FROM no_such_table", ())
+        cursor.close()
+
+    assert plan.startswith("EXPLAIN failed:")
+
+def test_drop_month_partitions_deletes_only_older_rows():
+    user_id = make_user()
+    db.save_watched_movies([
+        (user_id, make_movie(1), datetime.datetime(2026, 7, 31, 23, 59)),
+        (user_id, make_movie(2), datetime.datetime(2026, 8, 1, 0, 0)),
+        (user_id, make_movie(3), datetime.datetime(2026, 9, 15, 12, 0))
+    ])
+
+    with db.transaction() as conn:
+        db.backend.drop_month_partitions(conn, "watch_events", "watched_at", datetime.date(2026, 8, 1))
+
+    kept = db.fetch_all("""
+        SELECT m.tmdb_id FROM watch_events e JOIN movies m ON m.id = e.movie_id
+        ORDER BY m.tmdb_id
+    """)
+    assert [row[0] for row in kept] == [2, 3]
+
+def test_maintenance_keeps_events_newer_than_the_watermark(monkeypatch):
+    monkeypatch.setattr(db, "WATCH_EVENTS_RETENTION_MONTHS", 1)
+    user_id = make_user()
+    db.save_watched_movies([(user_id, make_movie(1), db.utcnow() - datetime.timedelta(days=120))])
+
+    # Not compacted yet, so the expired event must survive
+    assert db.maintain_watch_event_partitions()
+    assert db.fetch_one("SELECT COUNT(*) FROM watch_events")[0] == 1
+
+    db.compact_watch_events(lag_seconds=0)
+    assert db.maintain_watch_event_partitions()
+    assert db.fetch_one("SELECT COUNT(*) FROM watch_events")[0] == 0
@@ -0,0 +1,86 @@
+import datetime
+
+import database as db
+import manage
+from tests.conftest import make_user
+
+def login(username="user"):
+    make_user(username)
+    user_id, auth_token = db.authenticate_user(username, "password")
+    assert auth_token is not None
+    return user_id, auth_token
+
+def add_expired_tokens(user_id, count):
+    expired = datetime.datetime.now() - datetime.timedelta(days=1)
+    for n in range(count):
+        db.execute_query(
+            "INSERT INTO user_auth (user_id, auth_token, expires_at) VALUES (:user_id, :auth_token, :expires_at)",
+            {"user_id": user_id, "auth_token": f"expired-{n}", "expires_at": expired}
+        )
+
+def test_login_warms_the_cache():
+    user_id, auth_token = login()
+    hits = db.get_token_cache_stats()["hits"]
+
+    assert db.validate_token(auth_token) == (user_id, "user")
+    assert db.get_token_cache_stats()["hits"] == hits + 1
+
+def test_cache_miss_reads_the_database_and_caches():
+    user_id, auth_token = login()
+    with db._token_cache_lock:
+        db._token_cache.clear()
+    stats = db.get_token_cache_stats()
+
+    assert db.validate_token(auth_token) == (user_id, "user")
+    assert db.validate_token(auth_token) == (user_id, "user")
+
+    after = db.get_token_cache_stats()
+    assert (after["misses"], after["hits"]) == (stats["misses"] + 1, stats["hits"] + 1)
+
+def test_revoked_token_stops_validating():
+    _, auth_token = login()
+
+    assert db.revoke_token(auth_token)
+
+    assert db.validate_token(auth_token) == (None, None)
+    assert db.fetch_one("SELECT COUNT(*) FROM user_auth")[0] == 0
+
+def test_expired_and_unknown_tokens_are_rejected():
+    add_expired_tokens(make_user(), 1)
+
+    assert db.validate_token("expired-0") == (None, None)
+    assert db.validate_token("no-such-token") == (None, None)
+
+def test_reaper_deletes_expired_tokens_in_batches():
+    user_id, auth_token = login()
+    add_expired_tokens(user_id, 5)
+
+    assert db.reap_expired_tokens(batch_size=2) == 5
+
+    assert db.fetch_all("SELECT auth_token FROM user_auth") == [(auth_token,)]
+    assert db.validate_token(auth_token) == (user_id, "user")
+
+def test_reaper_drops_expired_cache_entries(monkeypatch):
+    monkeypatch.setattr(db, "TOKEN_CACHE_TTL_SECONDS", 0)
+    login()
+    assert db.get_token_cache_stats()["tokens"] == 1
+
+    db.reap_expired_tokens()
+
+    assert db.get_token_cache_stats()["tokens"] == 0
+
+def test_reap_tokens_command(capsys):
+    add_expired_tokens(make_user(), 3)
+
+    assert manage.main(["reap-tokens"]) == 0
+    assert "Deleted 3 expired auth tokens" in capsys.readouterr().out
+
+def test_reap_tokens_command_fails_when_a_batch_fails(monkeypatch, capsys):
+    def failing_reap(batch_size):
+        db.execute_query("DELETE FROM no_such_table")
+        return 0
+
+    monkeypatch.setattr(db, "reap_expired_tokens", failing_reap)
+
+    assert manage.main(["reap-tokens"]) == 1
+    assert "Failed to reap" in capsys.readouterr().out
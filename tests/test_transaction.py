@@ -0,0 +1,82 @@
+from sqlalchemy import text
+from sqlalchemy.exc import IntegrityError
+
+import database as db
+from tests.conftest import MISSING_USER_ID, make_movie, make_user
+
+def count(table):
+    return db.fetch_one(f"SELECT COUNT(*) FROM {table}")[0]
+
+def test_commits_when_the_block_exits():
+    with db.transaction() as conn:
+        conn.execute(text("INSERT INTO users (session_id) VALUES ('a')"))
+
+    assert db.get_last_transaction_error() is None
+    assert count("users") == 1
+
+def test_rolls_back_and_reports_the_error():
+    with db.transaction() as conn:
+        conn.execute(text("INSERT INTO users (session_id) VALUES ('a')"))
+        conn.execute(text("INSERT INTO users (session_id) VALUES ('a')"))
+
+    assert isinstance(db.get_last_transaction_error(), IntegrityError)
+    assert count("users") == 0
+
+def test_nested_blocks_roll_back_with_the_outer_one():
+    with db.transaction():
+        db.save_movies([make_movie(1)])
+        db.execute_query("INSERT INTO users (session_id) VALUES ('a')")
+        db.execute_query("INSERT INTO users (session_id) VALUES ('a')")
+
+    assert isinstance(db.get_last_transaction_error(), IntegrityError)
+    assert count("movies") == 0
+    assert count("users") == 0
+
+def test_next_transaction_clears_the_error():
+    db.execute_query("INSERT INTO users (session_id) VALUES ('a')")
+    assert db.execute_query("INSERT INTO users (session_id) VALUES ('a')") is None
+    assert db.get_last_transaction_error() is not None
+
+    assert db.execute_query("INSERT INTO users (session_id) VALUES ('b')") is not None
+    assert db.get_last_transaction_error() is None
+
+def test_read_only_block_refuses_writes():
+    with db.transaction(read_only=True):
+        try:
+            db.execute_query("INSERT INTO users (session_id) VALUES ('a')")
+        except RuntimeError:
+            pass
+        else:
+            raise AssertionError("write inside a read-only transaction was allowed")
+
+    assert count("users") == 0
+
+def test_failed_commit_is_not_reported_as_success(deferred_foreign_keys):
+    prefs = {'genres': [], 'year_range': [2000, 2020], 'min_rating': 6.0, 'languages': ['en']}
+
+    assert db.save_user_preferences(MISSING_USER_ID, prefs) is False
+    assert isinstance(db.get_last_transaction_error(), IntegrityError)
+
+    assert db.execute_query(
+        "INSERT INTO user_preferences (user_id, min_year, max_year, min_rating) VALUES (:user_id, 2000, 2020, 6.0)",
+        {"user_id": MISSING_USER_ID}
+    ) is None
+    assert db.save_user_ratings([(MISSING_USER_ID, make_movie(1), 4)]) is False
+
+    assert count("user_preferences") == 0
+    assert count("user_ratings") == 0
+    assert count("movies") == 0
+
+def test_helpers_succeed_once_committed(deferred_foreign_keys):
+    user_id = make_user()
+    prefs = {'genres': [], 'year_range': [2000, 2020], 'min_rating': 6.0, 'languages': ['en']}
+
+    assert db.save_user_preferences(user_id, prefs) is True
+    assert db.save_user_ratings([(user_id, make_movie(1), 4)]) is True
+    assert db.save_movies([make_movie(2)]).keys() == {2}
+
+def test_create_user_account_reports_a_taken_username():
+    user_id = make_user("alice")
+
+    assert db.create_user_account("alice", "other") == (None, "Username already exists")
+    assert db.fetch_one("SELECT id FROM users WHERE username = 'alice'")[0] == user_id
@@ -0,0 +1,33 @@
+import database as db
+from tests.conftest import make_movie
+
+def test_save_movies_returns_ids_of_new_and_existing_movies():
+    first = db.save_movies([make_movie(1), make_movie(2)])
+    second = db.save_movies([make_movie(2), make_movie(3), make_movie(3)])
+
+    assert second[2] == first[2]
+    assert set(second) == {2, 3}
+    assert db.fetch_one("SELECT COUNT(*) FROM movies")[0] == 3
+
+def test_save_movies_reuses_existing_genres():
+    db.save_movies([make_movie(1, genres=["Drama", "Comedy"])])
+    # Another writer adds a genre after this process loaded its map
+    db.get_genre_map()
+    db.execute_query("INSERT INTO genres (name) VALUES ('Horror') ON CONFLICT (name) DO NOTHING")
+    db.save_movies([make_movie(2, genres=["Drama", "Horror"])])
+
+    links = db.fetch_all("""
+        SELECT m.tmdb_id, g.name FROM movie_genres mg
+        JOIN movies m ON m.id = mg.movie_id
+        JOIN genres g ON g.id = mg.genre_id
+        ORDER BY m.tmdb_id, g.name
+    """)
+    assert [tuple(row) for row in links] == [(1, "Comedy"), (1, "Drama"), (2, "Drama"), (2, "Horror")]
+    assert db.fetch_one("SELECT COUNT(*) FROM genres WHERE name IN ('Drama', 'Horror')")[0] == 2
+
+def test_get_or_create_user_is_stable_per_session():
+    user_id = db.get_or_create_user("session-a")
+
+    assert user_id is not None
+    assert db.get_or_create_user("session-a") == user_id
+    assert db.get_or_create_user("session-b") != user_id
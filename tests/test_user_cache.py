@@ -0,0 +1,62 @@
+import database as db
+from tests.conftest import make_user
+
+PREFS = {'genres': [], 'year_range': [2000, 2020], 'min_rating': 6.0, 'languages': ['en']}
+
+def test_primary_reads_are_cached_until_invalidated():
+    user_id = make_user()
+    db.save_user_preferences(user_id, PREFS)
+    db.get_user_preferences(user_id)
+    hits = db.get_user_cache_stats()["hits"]
+
+    assert db.get_user_preferences(user_id)['languages'] == ['en']
+    assert db.get_user_cache_stats()["hits"] == hits + 1
+
+    db.save_user_preferences(user_id, dict(PREFS, languages=['hi']))
+    assert db.get_user_preferences(user_id)['languages'] == ['hi']
+
+def test_results_are_copies():
+    user_id = make_user()
+    db.save_user_preferences(user_id, PREFS)
+
+    db.get_user_preferences(user_id)['languages'].append('fr')
+
+    assert db.get_user_preferences(user_id)['languages'] == ['en']
+
+def test_lagging_replica_read_expires(replica, monkeypatch):
+    monkeypatch.setattr(db, "USER_CACHE_REPLICA_TTL_SECONDS", 0)
+    user_id = make_user()
+    db.save_user_preferences(user_id, PREFS)
+    replica()
+    # Written by something no session is sticky for, e.g. the write queue
+    db.save_user_preferences(user_id, dict(PREFS, languages=['hi']))
+
+    assert db.get_user_preferences(user_id)['languages'] == ['en']
+
+    replica()
+    assert db.get_user_preferences(user_id)['languages'] == ['hi']
+
+def test_replica_reads_are_cached_for_the_ttl(replica):
+    user_id = make_user()
+    db.save_user_preferences(user_id, PREFS)
+    replica()
+    db.get_user_preferences(user_id)
+    hits = db.get_user_cache_stats()["hits"]
+
+    db.get_user_preferences(user_id)
+
+    assert db.get_user_cache_stats()["hits"] == hits + 1
+
+def test_read_that_fell_back_to_the_primary_is_kept(tmp_path, monkeypatch):
+    # The replica's directory doesn't exist, so connecting to it fails
+    unreachable = db.backend.create_engine(f"sqlite:///{tmp_path}/missing/replica.db")
+    monkeypatch.setattr(db, "replica_engines", [unreachable])
+    monkeypatch.setattr(db, "_replica_down_until", {})
+    monkeypatch.setattr(db, "USER_CACHE_REPLICA_TTL_SECONDS", 0)
+    user_id = make_user()
+    db.get_user_preferences(user_id)
+    hits = db.get_user_cache_stats()["hits"]
+
+    db.get_user_preferences(user_id)
+
+    assert db.get_user_cache_stats()["hits"] == hits + 1
@@ -0,0 +1,96 @@
+import datetime
+
+import database as db
+from tests.conftest import make_movie, make_user
+
+def watched_pages(user_id, limit):
+    pages, cursor = [], None
+    while True:
+        rows, cursor = db.get_user_watched_movies_page(user_id, limit, cursor)
+        pages.append([row[0] for row in rows])
+        if cursor is None:
+            return pages
+
+def view_counts(user_id):
+    """tmdb_id -> view count over every page of a user's history"""
+    counts, cursor = {}, None
+    while True:
+        rows, cursor = db.get_user_watched_movies_page(user_id, 2, cursor)
+        counts.update({row[0]: row[5] for row in rows})
+        if cursor is None:
+            return counts
+
+def watermark():
+    value = db.fetch_one("SELECT watermark FROM compaction_state WHERE name = 'watch_events'")[0]
+    return datetime.datetime.fromisoformat(value) if isinstance(value, str) else value
+
+def test_compaction_rolls_events_up_once():
+    alice, bob = make_user("alice"), make_user("bob")
+    watched_at = datetime.datetime(2026, 9, 1, 12, 0)
+    db.save_watched_movies([
+        (alice, make_movie(1), watched_at),
+        (alice, make_movie(1), watched_at + datetime.timedelta(hours=1)),
+        (bob, make_movie(1), watched_at)
+    ])
+
+    assert db.compact_watch_events(lag_seconds=0) == 3
+    # Everything up to the watermark is already counted
+    assert db.compact_watch_events(lag_seconds=0) == 0
+
+    assert db.fetch_all("SELECT user_id, view_count FROM user_movie_views ORDER BY user_id") == [(alice, 2), (bob, 1)]
+    assert db.fetch_one("SELECT view_count FROM movie_view_stats")[0] == 3
+    assert db.fetch_one("SELECT view_count FROM movie_daily_views")[0] == 3
+
+def test_events_inside_the_lag_wait_for_a_later_run():
+    user_id = make_user()
+    now = db.utcnow()
+    db.save_watched_movies([
+        (user_id, make_movie(1), now - datetime.timedelta(hours=1)),
+        (user_id, make_movie(2), now - datetime.timedelta(seconds=30))
+    ])
+
+    assert db.compact_watch_events(lag_seconds=300) == 1
+    # The watermark stops short of the event still inside the lag
+    assert watermark() < now - datetime.timedelta(seconds=30)
+    assert db.compact_watch_events(lag_seconds=0) == 1
+
+def test_compacted_views_with_tied_timestamps_page_without_gaps_or_repeats():
+    user_id = make_user()
+    watched_at = db.utcnow() - datetime.timedelta(hours=1)
+    db.save_watched_movies([(user_id, make_movie(tmdb_id), watched_at) for tmdb_id in range(1, 6)])
+    assert db.compact_watch_events(lag_seconds=0) == 5
+
+    pages = watched_pages(user_id, 2)
+
+    assert [len(page) for page in pages] == [2, 2, 1]
+    assert sorted(sum(pages, [])) == [1, 2, 3, 4, 5]
+
+def test_uncompacted_views_lead_the_first_page():
+    user_id = make_user()
+    earlier = db.utcnow() - datetime.timedelta(hours=1)
+    db.save_watched_movies([(user_id, make_movie(tmdb_id), earlier) for tmdb_id in (1, 2, 3)])
+    db.compact_watch_events(lag_seconds=0)
+    db.save_watched_movies([(user_id, make_movie(4)), (user_id, make_movie(1))])
+
+    pages = watched_pages(user_id, 2)
+
+    assert sorted(pages[0][:2]) == [1, 4]
+    assert sorted(sum(pages, [])) == [1, 2, 3, 4]
+
+def test_page_counts_add_uncompacted_events_to_the_rollup():
+    user_id = make_user()
+    earlier = db.utcnow() - datetime.timedelta(hours=1)
+    db.save_watched_movies([(user_id, make_movie(1), earlier), (user_id, make_movie(1), earlier)])
+    db.compact_watch_events(lag_seconds=0)
+    db.save_watched_movies([(user_id, make_movie(1)), (user_id, make_movie(2))])
+
+    assert view_counts(user_id) == {1: 3, 2: 1}
+
+    db.compact_watch_events(lag_seconds=0)
+    assert view_counts(user_id) == {1: 3, 2: 1}
+
+def test_unused_watched_movies_index_is_dropped():
+    index = db.fetch_one(
+        "SELECT name FROM sqlite_master WHERE name = 'idx_user_watched_movies_user_watched_id'"
+    )
+    assert index is None
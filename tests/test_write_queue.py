@@ -0,0 +1,183 @@
+import json
+import time
+
+import pytest
+
+import database as db
+import write_queue
+from tests.conftest import MISSING_USER_ID, add_missing_user, make_movie, make_user
+
+@pytest.fixture
+def queue(tmp_path):
+    """A queue whose worker never flushes on its own, so tests decide when writes happen"""
+    queue = write_queue.WriteBehindQueue(batch_size=1000, flush_interval=60, retry_delay=60,
+                                         max_retry_delay=600, dead_letter_file=str(tmp_path / "dead.jsonl"))
+    yield queue
+    queue.stop()
+
+def ratings():
+    return db.fetch_all("SELECT user_id, movie_id, rating FROM user_ratings")
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+def test_repeated_events_coalesce(queue):
+    user_id = make_user()
+    queue.put("rating", user_id, make_movie(1), 3)
+    queue.put("rating", user_id, make_movie(1), 5)
+    queue.put("watched", user_id, make_movie(1))
+    queue.put("watched", user_id, make_movie(1))
+    assert queue.depth() == 2
+
+    queue.flush()
+
+    assert [row[2] for row in ratings()] == [5]
+    assert db.fetch_one("SELECT COUNT(*) FROM watch_events")[0] == 1
+    stats = queue.get_stats()
+    assert (stats["enqueued"], stats["coalesced"], stats["flushed"]) == (2, 2, 2)
+
+def test_failed_batch_backs_off_exponentially(queue):
+    queue.put("rating", MISSING_USER_ID, make_movie(1), 4)
+
+    queue.flush()
+    assert queue.get_stats()["retrying"] == 1
+    assert 50 < queue._retry_at - time.monotonic() <= 60
+
+    queue.flush()
+    assert 110 < queue._retry_at - time.monotonic() <= 120
+    assert queue.get_stats()["failed"] == 2
+
+    add_missing_user()
+    queue.flush()
+    assert len(ratings()) == 1
+    assert queue._retry_at is None
+    assert queue.depth() == 0
+
+def test_worker_retries_after_the_backoff(queue):
+    queue.retry_delay = 0.05
+    queue.put("rating", MISSING_USER_ID, make_movie(1), 4)
+    queue.flush()
+    assert queue.depth() == 1
+
+    add_missing_user()
+    wait_for(lambda: len(ratings()) == 1)
+    assert queue.get_stats()["failed"] >= 1
+
+def test_newer_event_replaces_a_failed_one(queue):
+    queue.put("rating", MISSING_USER_ID, make_movie(1), 2)
+    queue.flush()
+
+    queue.put("rating", MISSING_USER_ID, make_movie(1), 5)
+    add_missing_user()
+    queue.flush()
+
+    assert [row[2] for row in ratings()] == [5]
+
+def test_events_are_dead_lettered_after_the_last_retry(queue, monkeypatch):
+    monkeypatch.setattr(write_queue, "WRITE_QUEUE_MAX_RETRIES", 1)
+    queue.put("rating", MISSING_USER_ID, make_movie(1), 4)
+
+    queue.flush()
+    queue.flush()
+
+    assert queue.depth() == 0
+    with open(queue.dead_letter_file) as f:
+        dead = [json.loads(line) for line in f]
+    assert [(event["kind"], event["user_id"], event["movie"]['id'], event["rating"]) for event in dead] == [
+        ("rating", MISSING_USER_ID, 1, 4)
+    ]
+
+    # Once the cause is fixed they can be replayed
+    add_missing_user()
+    assert write_queue.replay_dead_letters(queue.dead_letter_file) == 1
+    assert len(ratings()) == 1
+    assert write_queue.replay_dead_letters(queue.dead_letter_file) == 0
+
+def test_failed_replay_keeps_the_events(queue, monkeypatch):
+    monkeypatch.setattr(write_queue, "WRITE_QUEUE_MAX_RETRIES", 0)
+    queue.put("watched", MISSING_USER_ID, make_movie(1))
+    queue.put("rating", MISSING_USER_ID, make_movie(2), 4)
+    queue.flush()
+
+    assert write_queue.replay_dead_letters(queue.dead_letter_file) is None
+    with open(queue.dead_letter_file) as f:
+        assert len(f.readlines()) == 2
+
+def test_stop_dead_letters_what_it_cannot_write(queue):
+    user_id = make_user()
+    queue.put("rating", user_id, make_movie(1), 3)
+    queue.put("rating", MISSING_USER_ID, make_movie(2), 4)
+
+    queue.stop()
+
+    assert queue.depth() == 0
+    assert ratings() == []
+    with open(queue.dead_letter_file) as f:
+        assert len(f.readlines()) == 2
+
+def test_worker_goes_idle_once_a_failed_batch_is_dead_lettered(queue, monkeypatch):
+    monkeypatch.setattr(write_queue, "WRITE_QUEUE_MAX_RETRIES", 1)
+    queue.retry_delay = 0.01
+    queue.put("rating", MISSING_USER_ID, make_movie(1), 4)
+    queue.flush()
+    # The worker retries once after the backoff and then dead-letters the event
+    wait_for(lambda: queue.get_stats()["dead_lettered"] == 1)
+
+    flushes = []
+    flush = queue.flush
+    monkeypatch.setattr(queue, "flush", lambda: flushes.append(1) or flush())
+    time.sleep(0.2)
+
+    assert queue._retry_at is None
+    assert len(flushes) <= 1
+
+def test_replayed_views_survive_an_earlier_compaction(queue, monkeypatch):
+    monkeypatch.setattr(write_queue, "WRITE_QUEUE_MAX_RETRIES", 0)
+    # watch_events has no foreign keys; the rating fails the batch it shares
+    queue.put("watched", MISSING_USER_ID, make_movie(1))
+    queue.put("rating", MISSING_USER_ID, make_movie(2), 4)
+    queue.flush()
+    add_missing_user()
+    # The watermark moves past the view's click time before it is replayed
+    db.compact_watch_events(lag_seconds=0)
+
+    assert write_queue.replay_dead_letters(queue.dead_letter_file) == 2
+
+    rows, _ = db.get_user_watched_movies_page(MISSING_USER_ID, 10, None)
+    assert [row[0] for row in rows] == [1]
+    assert list(db.get_seen_movie_ids(MISSING_USER_ID)) == [1, 2]
+    assert db.compact_watch_events(lag_seconds=0) == 1
+    db.invalidate_user_cache(MISSING_USER_ID, db.get_user_watched_movies_page)
+    rows, _ = db.get_user_watched_movies_page(MISSING_USER_ID, 10, None)
+    assert [(row[0], row[5]) for row in rows] == [(1, 1)]
+
+def test_user_flush_writes_only_that_users_new_events(queue):
+    alice, bob = make_user("alice"), make_user("bob")
+    queue.put("rating", MISSING_USER_ID, make_movie(1), 4)
+    queue.flush()
+    queue.put("rating", alice, make_movie(2), 5)
+    queue.put("rating", bob, make_movie(3), 3)
+
+    queue.flush(alice)
+
+    assert [tuple(row) for row in db.fetch_all("SELECT user_id, rating FROM user_ratings")] == [(alice, 5)]
+    stats = queue.get_stats()
+    # The failed batch keeps backing off instead of being retried early
+    assert (stats["failed"], stats["retrying"], stats["depth"]) == (1, 1, 2)
+
+def test_user_flush_keeps_the_failed_batch_on_its_schedule(queue):
+    alice = make_user("alice")
+    queue.put("rating", MISSING_USER_ID, make_movie(1), 4)
+    queue.flush()
+    retry_at = queue._retry_at
+    queue.put("rating", alice, make_movie(2), 5)
+
+    queue.flush(alice)
+
+    assert queue._retry_at == retry_at
+    # The worker would crash comparing the clock with a cleared retry time
+    assert queue._is_due() is False
+    assert queue._worker.is_alive()
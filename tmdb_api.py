@@ -1,12 +1,18 @@
 import requests
 import os
 import streamlit as st
+import profiler
 
 # TMDB API configuration
-TMDB_API_KEY = st.secrets["TMDB_API_KEY"]["dd6a4c6a56d6c6008c9ce48992663490"]
-TMDB_BASE_URL = "https://api.themoviedb.org/3"
+TMDB_API_KEY = os.getenv("TMDB_API_KEY", "")
+# Overridable to point at a stand-in server, such as the one loadtest.py runs
+TMDB_BASE_URL = os.getenv("TMDB_BASE_URL", "https://api.themoviedb.org/3")
 TMDB_IMAGE_BASE_URL = "https://api.themoviedb.org/3"
+# Seconds to wait for TMDB to connect and to respond, so a stalled request can't hang a rerun or a prefetch thread
+TMDB_REQUEST_TIMEOUT = float(os.getenv("TMDB_REQUEST_TIMEOUT", "10"))
 
+# Timed outside the cache, so hits show up as well as fetches
+@profiler.timed()
 @st.cache_data(ttl=3600)
 def get_trending_movies():
     """Fetch trending movies from TMDB API"""
@@ -16,7 +22,7 @@ def get_trending_movies():
             "api_key": TMDB_API_KEY,
             "language": "en-US"
         }
-        response = requests.get(url, params=params)
+        response = requests.get(url, params=params, timeout=TMDB_REQUEST_TIMEOUT)
         response.raise_for_status()
         
         movies = response.json().get('results', [])
@@ -41,6 +47,7 @@ def get_trending_movies():
         st.error(f"Error fetching trending movies: {str(e)}")
         return []
 
+@profiler.timed()
 @st.cache_data(ttl=3600)
 def search_movies(query):
     """Search for movies by query"""
@@ -56,7 +63,7 @@ def search_movies(query):
             "page": 1,
             "include_adult": False
         }
-        response = requests.get(url, params=params)
+        response = requests.get(url, params=params, timeout=TMDB_REQUEST_TIMEOUT)
         response.raise_for_status()
         
         movies = response.json().get('results', [])
@@ -90,6 +97,7 @@ def search_movies(query):
         st.error(f"Error searching movies: {str(e)}")
         return []
 
+@profiler.timed()
 @st.cache_data(ttl=3600)
 def get_movie_details(movie_id):
     """Get detailed information about a specific movie"""
@@ -101,7 +109,7 @@ def get_movie_details(movie_id):
             "language": "en-US",
             "append_to_response": "credits,videos,recommendations,watch/providers,release_dates"
         }
-        response = requests.get(url, params=params)
+        response = requests.get(url, params=params, timeout=TMDB_REQUEST_TIMEOUT)
         response.raise_for_status()
         
         movie = response.json()
@@ -149,6 +157,7 @@ def get_movie_details(movie_id):
             'vote_average': movie.get('vote_average'),
             'runtime': movie.get('runtime'),
             'overview': movie.get('overview'),
+            'genre_ids': [genre.get('id') for genre in movie.get('genres', [])],
             'genres': [genre.get('name') for genre in movie.get('genres', [])],
             'original_language': movie.get('original_language'),
             'production_companies': [company.get('name') for company in movie.get('production_companies', [])],
@@ -170,49 +179,64 @@ def get_movie_details(movie_id):
         st.error(f"Error fetching movie details: {str(e)}")
         return {}
 
+def discover_movies(genres, year_range, rating_min, languages, page=1):
+    """
+    Fetch one page of TMDB discover results for a set of preferences
+    
+    Unlike the cached fetchers this raises on errors and doesn't touch the
+    page, so it can run on the feed's prefetch threads.
+    
+    Returns:
+    tuple: (movies, total_pages)
+    """
+    url = f"{TMDB_BASE_URL}/discover/movie"
+    params = {
+        "api_key": TMDB_API_KEY,
+        "language": "en-US",
+        "sort_by": "popularity.desc",
+        "include_adult": False,
+        "include_video": False,
+        "page": page,
+        "with_genres": ",".join(map(str, genres)),
+        "primary_release_date.gte": f"{year_range[0]}-01-01",
+        "primary_release_date.lte": f"{year_range[1]}-12-31",
+        "vote_average.gte": rating_min,
+        "with_original_language": ",".join(languages) if languages else None
+    }
+    response = requests.get(url, params=params, timeout=TMDB_REQUEST_TIMEOUT)
+    response.raise_for_status()
+    
+    data = response.json()
+    movies = data.get('results', [])
+    
+    # Process movie data
+    processed_movies = []
+    for movie in movies:
+        processed_movie = {
+            'id': movie.get('id'),
+            'title': movie.get('title'),
+            'poster_path': f"{TMDB_IMAGE_BASE_URL}{movie.get('poster_path')}" if movie.get('poster_path') else None,
+            'release_date': movie.get('release_date'),
+            'vote_average': movie.get('vote_average'),
+            'overview': movie.get('overview'),
+            'genre_ids': movie.get('genre_ids', []),
+            'original_language': movie.get('original_language')
+        }
+        processed_movies.append(processed_movie)
+    
+    return processed_movies, data.get('total_pages', page)
+
+@profiler.timed()
 @st.cache_data(ttl=3600)
-def get_movies_by_preferences(genres, year_range, rating_min, languages):
+def get_movies_by_preferences(genres, year_range, rating_min, languages, page=1):
     """Get movies based on user preferences"""
     try:
-        url = f"{TMDB_BASE_URL}/discover/movie"
-        params = {
-            "api_key": TMDB_API_KEY,
-            "language": "en-US",
-            "sort_by": "popularity.desc",
-            "include_adult": False,
-            "include_video": False,
-            "page": 1,
-            "with_genres": ",".join(map(str, genres)),
-            "primary_release_date.gte": f"{year_range[0]}-01-01",
-            "primary_release_date.lte": f"{year_range[1]}-12-31",
-            "vote_average.gte": rating_min,
-            "with_original_language": ",".join(languages) if languages else None
-        }
-        response = requests.get(url, params=params)
-        response.raise_for_status()
-        
-        movies = response.json().get('results', [])
-        
-        # Process movie data
-        processed_movies = []
-        for movie in movies:
-            processed_movie = {
-                'id': movie.get('id'),
-                'title': movie.get('title'),
-                'poster_path': f"{TMDB_IMAGE_BASE_URL}{movie.get('poster_path')}" if movie.get('poster_path') else None,
-                'release_date': movie.get('release_date'),
-                'vote_average': movie.get('vote_average'),
-                'overview': movie.get('overview'),
-                'genre_ids': movie.get('genre_ids', []),
-                'original_language': movie.get('original_language')
-            }
-            processed_movies.append(processed_movie)
-        
-        return processed_movies
+        return discover_movies(genres, year_range, rating_min, languages, page)[0]
     except Exception as e:
         st.error(f"Error fetching movies by preferences: {str(e)}")
         return []
 
+@profiler.timed()
 @st.cache_data(ttl=3600)
 def get_similar_movies(movie_id):
     """Get movies similar to a specific movie"""
@@ -226,7 +250,7 @@ def get_similar_movies(movie_id):
             "language": "en-US",
             "page": 1
         }
-        response = requests.get(url, params=params)
+        response = requests.get(url, params=params, timeout=TMDB_REQUEST_TIMEOUT)
         response.raise_for_status()
         
         movies = response.json().get('results', [])
@@ -1,6 +1,5 @@
 import streamlit as st
-from movie_data import get_genre_names
-import random
+import profiler
 
 def add_custom_css():
     """Add custom CSS to style the app with Netflix-inspired theme"""
@@ -146,88 +145,115 @@ def add_custom_css():
     </style>
     """, unsafe_allow_html=True)
 
-def display_movie_card(movie):
-    """Display a movie card with poster, title, rating, and release year"""
-    # Use one of the pre-fetched stock photos if no poster is available
-    poster_url = movie.get('poster_path')
-    if not poster_url:
-        stock_posters = [
-            "https://images.unsplash.com/photo-1626814026160-2237a95fc5a0",
-            "https://images.unsplash.com/photo-1572188863110-46d457c9234d",
-            "https://images.unsplash.com/photo-1536440136628-849c177e76a1",
-            "https://images.unsplash.com/photo-1572988276585-71035689a285",
-            "https://images.unsplash.com/photo-1623116135518-7953c5038f5b",
-            "https://images.unsplash.com/photo-1440404653325-ab127d49abc1",
-            "https://images.unsplash.com/photo-1509347528160-9a9e33742cdb",
-            "https://images.unsplash.com/photo-1569793667639-dae11573b34f"
-        ]
-        poster_url = random.choice(stock_posters)
-    
-    # Extract release year
-    release_year = "Unknown"
-    if movie.get('release_date'):
-        try:
-            release_year = movie.get('release_date', '')[:4]
-        except (IndexError, TypeError):
-            pass
-    
-    # Convert genre IDs to names if needed
-    genre_names = []
-    if 'genre_ids' in movie:
-        genre_names = get_genre_names(movie.get('genre_ids', []))
-    elif 'genres' in movie:
-        genre_names = movie.get('genres', [])
-        
-    # Show only first 2 genres
-    if genre_names:
-        genres_display = ", ".join([str(g) for g in genre_names[:2]])
-    else:
-        genres_display = ""
-    
-    # Movie rating (TMDB rating)
-    rating = movie.get('vote_average', 0)
-    
-    # User rating if available
-    user_rating = movie.get('user_rating')
-    user_rating_display = f"<div class='movie-user-rating'>Your Rating: {user_rating}★</div>" if user_rating else ""
-    
-    # Create clickable card
-    card_html = f"""
-    <div class="movie-card" onclick="handleClick({movie['id']})">
-        <img src="{poster_url}" class="movie-poster" alt="{movie['title']} poster">
-        <div class="movie-title">{movie['title']}</div>
-        <div class="movie-rating">★ {rating:.1f}</div>
-        {user_rating_display}
-        <div class="movie-year">{release_year}</div>
-        <div class="movie-genre">{genres_display}</div>
-    </div>
+# Movie grids render as one component per grid: the cards are drawn in the
+# browser from a single data payload and a click sends back just the movie id
+MOVIE_GRID_CSS = """
+.movie-grid {
+    display: grid;
+    grid-template-columns: repeat(4, minmax(0, 1fr));
+    gap: 16px;
+}
+
+.movie-grid-card {
+    background: none;
+    border: none;
+    color: inherit;
+    cursor: pointer;
+    font: inherit;
+    padding: 0;
+    text-align: left;
+    transition: transform 0.3s;
+}
+
+.movie-grid-card:hover {
+    transform: scale(1.05);
+}
+
+.movie-grid-card img {
+    width: 100%;
+    max-width: 150px;
+    aspect-ratio: 2 / 3;
+    object-fit: cover;
+    border-radius: 5px;
+    display: block;
+}
+
+.movie-grid-caption {
+    font-size: 0.85em;
+    margin-top: 6px;
+    white-space: pre-line;
+    color: var(--st-text-color);
+}
+"""
+
+MOVIE_GRID_JS = """
+export default function(component) {
+    const { data, setTriggerValue, parentElement } = component;
+
+    let grid = parentElement.querySelector('.movie-grid');
+    if (!grid) {
+        grid = document.createElement('div');
+        grid.className = 'movie-grid';
+        parentElement.appendChild(grid);
+    }
+
+    // Text goes through textContent so titles are never parsed as HTML
+    grid.replaceChildren(...data.map((card) => {
+        const button = document.createElement('button');
+        button.className = 'movie-grid-card';
+        button.title = card.title;
+
+        const img = document.createElement('img');
+        img.src = card.poster;
+        img.alt = card.title + ' poster';
+        img.loading = 'lazy';
+
+        const caption = document.createElement('div');
+        caption.className = 'movie-grid-caption';
+        caption.textContent = card.caption;
+
+        button.append(img, caption);
+        button.onclick = () => setTriggerValue('select', card.id);
+        return button;
+    }));
+}
+"""
+
+_movie_grid = st.components.v2.component("movie_grid", css=MOVIE_GRID_CSS, js=MOVIE_GRID_JS)
+
+@profiler.timed()
+def display_movie_grid(movies, key, caption_extra=None):
     """
+    Display movies as a 4-column grid of clickable posters
     
-    # Add view details button to the HTML
-    import random
-    import time
-    unique_key = f"btn_{movie['id']}_{random.randint(1000, 9999)}_{int(time.time())}"
+    Parameters:
+    movies (list): Movie dictionaries with at least id and title
+    key (str): Stable widget key for the grid
+    caption_extra (callable, optional): Returns an extra caption line for a movie
     
-    # Use a form to handle the button click properly
-    with st.form(key=f"form_{unique_key}"):
-        st.markdown(card_html, unsafe_allow_html=True)
-        submit_button = st.form_submit_button(f"View Details: {movie['title']}")
-        
-        if submit_button:
-            # Import here to avoid circular imports
-            from quiz import get_or_create_user
-            import database as db
-            
-            # Mark movie as watched when viewing details
-            user_id = get_or_create_user()
-            if user_id:
-                db.save_watched_movie(user_id, movie)
-                
-            # Navigate to details page
-            st.session_state.selected_movie = movie['id']
-            st.session_state.current_view = "details"
-            st.rerun()
+    Returns:
+    dict: The movie clicked in this rerun, or None
+    """
+    cards = []
+    for movie in movies:
+        caption = f"{movie.get('title')} ({(movie.get('release_date') or '')[:4]})\n★ {movie.get('vote_average') or 0:.1f}"
+        if caption_extra:
+            caption += "\n" + caption_extra(movie)
+        cards.append({
+            'id': movie['id'],
+            'title': movie.get('title') or "",
+            'poster': movie.get('poster_path') or "https://via.placeholder.com/200x300?text=No+Image",
+            'caption': caption
+        })
+    
+    result = _movie_grid(key=key, data=cards, on_select_change=lambda: None)
+    
+    selected_id = result.select
+    if selected_id is None:
+        return None
+    return next((movie for movie in movies if movie['id'] == selected_id), None)
 
+@profiler.timed()
 def display_movie_details(movie):
     """Display detailed view of a movie with enhanced information"""
     # Background image
@@ -240,7 +266,7 @@ def display_movie_details(movie):
             "https://images.unsplash.com/photo-1682872368723-e292c23b364f",
             "https://images.unsplash.com/photo-1738193026574-cfbcccbeb052"
         ]
-        backdrop_url = random.choice(cinema_backgrounds)
+        backdrop_url = cinema_backgrounds[(movie.get('id') or 0) % len(cinema_backgrounds)]
     
     st.markdown(f'<img src="{backdrop_url}" class="movie-backdrop" alt="Movie backdrop">', unsafe_allow_html=True)
     
@@ -484,19 +510,24 @@ def display_movie_details(movie):
         trailer_url = f"https://www.youtube.com/embed/{movie.get('trailer')}"
         st.markdown(f'<iframe width="100%" height="400" src="{trailer_url}" frameborder="0" allow="accelerometer; autoplay; clipboard-write; encrypted-media; gyroscope; picture-in-picture" allowfullscreen></iframe>', unsafe_allow_html=True)
     
-    # User rating section
+    display_rating_section(movie)
+
+@st.fragment
+@profiler.fragment()
+def display_rating_section(movie):
+    """Show the rating slider; moving it or submitting reruns only this section"""
     st.subheader("Rate this movie")
     
     user_rating = st.slider("Your rating", 1, 10, 8)
     
     from quiz import get_or_create_user
-    import database as db
+    import write_queue
     
     if st.button("Submit Rating", key=f"rate_btn_{movie.get('id')}"):
         user_id = get_or_create_user()
         if user_id:
-            # Save rating to database
-            if db.save_user_rating(user_id, movie, user_rating):
+            # Queue the rating; it is written in the background
+            if write_queue.record_rating(user_id, movie, user_rating):
                 st.success(f"Thanks for rating this movie {user_rating}/10!")
             else:
                 st.error("Failed to save your rating. Please try again.")
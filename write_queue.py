@@ -0,0 +1,311 @@
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+
+import database as db
+
+# Flush once this many events are pending...
+WRITE_QUEUE_BATCH_SIZE = int(os.getenv("WRITE_QUEUE_BATCH_SIZE", "100"))
+# ...or once the oldest pending event is this many seconds old
+WRITE_QUEUE_FLUSH_INTERVAL = float(os.getenv("WRITE_QUEUE_FLUSH_INTERVAL", "0.5"))
+# Times a batch is retried before its events go to the dead-letter file
+WRITE_QUEUE_MAX_RETRIES = int(os.getenv("WRITE_QUEUE_MAX_RETRIES", "5"))
+# Seconds before retrying after a failed flush, doubling with each consecutive failure...
+WRITE_QUEUE_RETRY_DELAY = float(os.getenv("WRITE_QUEUE_RETRY_DELAY", "1"))
+# ...up to this many
+WRITE_QUEUE_MAX_RETRY_DELAY = float(os.getenv("WRITE_QUEUE_MAX_RETRY_DELAY", "30"))
+# JSON lines file for events that still fail after the last retry; `manage.py replay-dead-letters` writes them
+WRITE_QUEUE_DEAD_LETTER_FILE = os.getenv("WRITE_QUEUE_DEAD_LETTER_FILE", "write_queue_dead_letters.jsonl")
+# Set to false to write events synchronously, as before the queue existed
+WRITE_QUEUE_ENABLED = os.getenv("WRITE_QUEUE_ENABLED", "true").lower() in ("1", "true", "yes")
+# Flush latencies kept for the stats
+MAX_RECORDED_FLUSHES = 100
+
+logger = logging.getLogger("chalchitra.write_queue")
+
+class WriteBehindQueue:
+    """
+    Buffer watch and rating events and write them in batched transactions
+
+    Events are keyed by (kind, user_id, tmdb_id), so repeated views of a
+    movie collapse into one event and a newer rating replaces an older one
+    before either reaches the database. A worker thread flushes when the
+    batch size or the flush interval is reached.
+
+    A failed batch is held back and retried with exponential backoff; the
+    worker doesn't flush while backing off. Events that fail
+    WRITE_QUEUE_MAX_RETRIES retries, or the final flush on stop(), are
+    appended to the dead-letter file instead of being dropped.
+    """
+    def __init__(self, batch_size=WRITE_QUEUE_BATCH_SIZE, flush_interval=WRITE_QUEUE_FLUSH_INTERVAL,
+                 retry_delay=WRITE_QUEUE_RETRY_DELAY, max_retry_delay=WRITE_QUEUE_MAX_RETRY_DELAY,
+                 dead_letter_file=WRITE_QUEUE_DEAD_LETTER_FILE):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.dead_letter_file = dead_letter_file
+        self._pending = OrderedDict()
+        self._oldest_at = None
+        # Events of failed batches, waiting out the backoff until _retry_at
+        self._retrying = OrderedDict()
+        self._retry_at = None
+        self._failures = 0
+        self._condition = threading.Condition()
+        # Held for the whole of a flush so synchronous flushes wait for the worker's
+        self._flush_lock = threading.Lock()
+        self._worker = None
+        self._stopping = False
+        self._stats = {"enqueued": 0, "coalesced": 0, "flushed": 0, "flushes": 0, "failed": 0,
+                       "retried": 0, "dead_lettered": 0}
+        self._flush_latencies = deque(maxlen=MAX_RECORDED_FLUSHES)
+
+    def put(self, kind, user_id, movie, rating=None):
+        """Queue an event; returns immediately"""
+        key = (kind, user_id, movie['id'])
+
+        with self._condition:
+            if self._worker is None:
+                self._start()
+
+            if key in self._pending:
+                self._stats["coalesced"] += 1
+            else:
+                self._stats["enqueued"] += 1
+
+            # Watch events keep their click time, since the log is compacted by time
+            self._pending[key] = {"movie": movie, "rating": rating, "attempts": 0, "at": db.utcnow()}
+            if self._oldest_at is None:
+                self._oldest_at = time.monotonic()
+            if len(self._pending) >= self.batch_size:
+                self._condition.notify()
+
+    def flush(self, user_id=None):
+        """
+        Write pending events now, in the caller's thread
+
+        Without a user_id every event is written, including ones backing
+        off. With one, only that user's new events are; other sessions'
+        events and failed batches are left to the worker and its backoff.
+        """
+        with self._flush_lock:
+            with self._condition:
+                if user_id is None:
+                    # A newer event for the same movie replaces a failed one
+                    batch = self._retrying
+                    batch.update(self._pending)
+                    self._pending, self._retrying = OrderedDict(), OrderedDict()
+                    self._oldest_at = None
+                else:
+                    batch = OrderedDict((key, event) for key, event in self._pending.items() if key[1] == user_id)
+                    for key in batch:
+                        del self._pending[key]
+                    if not self._pending:
+                        self._oldest_at = None
+
+            if batch:
+                self._write(batch)
+
+    def stop(self):
+        """Stop the worker and drain the queue, dead-lettering what the final flush can't write"""
+        with self._condition:
+            self._stopping = True
+            self._condition.notify()
+
+        if self._worker is not None:
+            self._worker.join(timeout=self.flush_interval + 5)
+        # Events that superseded a failing one are still pending after a flush
+        while self.depth():
+            self.flush()
+
+    def depth(self):
+        """Number of events waiting to be written, including ones backing off"""
+        with self._condition:
+            return len(self._pending) + len(self._retrying)
+
+    def get_stats(self):
+        """Get queue depth, event counters and flush latencies in milliseconds"""
+        with self._condition:
+            stats = dict(self._stats, depth=len(self._pending) + len(self._retrying),
+                         retrying=len(self._retrying))
+            latencies = list(self._flush_latencies)
+
+        stats["last_flush_ms"] = latencies[-1] if latencies else 0.0
+        stats["avg_flush_ms"] = sum(latencies) / len(latencies) if latencies else 0.0
+        stats["max_flush_ms"] = max(latencies) if latencies else 0.0
+        return stats
+
+    def _start(self):
+        self._worker = threading.Thread(target=self._run, name="chalchitra-write-queue", daemon=True)
+        self._worker.start()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._stopping and not self._is_due():
+                    timeout = None
+                    if self._retrying:
+                        timeout = max(self._retry_at - time.monotonic(), 0)
+                    elif self._oldest_at is not None:
+                        timeout = max(self._oldest_at + self.flush_interval - time.monotonic(), 0)
+                    self._condition.wait(timeout)
+
+                if self._stopping:
+                    return
+
+            self.flush()
+
+    def _is_due(self):
+        # While a failed batch backs off, new events wait with it
+        if self._retrying:
+            return time.monotonic() >= self._retry_at
+        if not self._pending:
+            return False
+        return (len(self._pending) >= self.batch_size
+                or time.monotonic() - self._oldest_at >= self.flush_interval)
+
+    def _write(self, batch):
+        watched = [(user_id, event["movie"], event["at"])
+                   for (kind, user_id, _), event in batch.items() if kind == "watched"]
+        ratings = [(user_id, event["movie"], event["rating"])
+                   for (kind, user_id, _), event in batch.items() if kind == "rating"]
+
+        started_at = time.perf_counter()
+        # Both kinds commit together so a retry never writes half a batch twice
+        saved = False
+        with db.transaction():
+            saved = db.save_watched_movies(watched) and db.save_user_ratings(ratings)
+        # transaction() swallows errors, so check it actually committed
+        saved = saved and db.get_last_transaction_error() is None
+        elapsed_ms = (time.perf_counter() - started_at) * 1000
+
+        error = db.get_last_transaction_error()
+        dead = OrderedDict()
+        with self._condition:
+            self._flush_latencies.append(elapsed_ms)
+            self._stats["flushes"] += 1
+            if saved:
+                self._stats["flushed"] += len(batch)
+                # A user's flush can succeed while a failed batch is still backing off
+                if not self._retrying:
+                    self._failures = 0
+                    self._retry_at = None
+                return
+
+            self._stats["failed"] += 1
+            self._failures += 1
+            for key, event in batch.items():
+                event["attempts"] += 1
+                if key in self._pending:
+                    # Superseded while the batch was being written
+                    self._stats["coalesced"] += 1
+                elif self._stopping or event["attempts"] > WRITE_QUEUE_MAX_RETRIES:
+                    dead[key] = event
+                else:
+                    self._retrying[key] = event
+                    self._stats["retried"] += 1
+            self._stats["dead_lettered"] += len(dead)
+            if self._retrying:
+                delay = min(self.retry_delay * 2 ** (self._failures - 1), self.max_retry_delay)
+                self._retry_at = time.monotonic() + delay
+                # The worker may be asleep until a later deadline
+                self._condition.notify()
+            else:
+                # Everything was dead-lettered or superseded; there is nothing to back off
+                self._retry_at = None
+
+        logger.error("write-behind flush of %d events failed (%d in a row): %s", len(batch), self._failures, error)
+        if dead:
+            self._dead_letter(dead, error)
+
+    def _dead_letter(self, events, error):
+        """Append events that can't be written to the dead-letter file, one JSON object per line"""
+        lines = "".join(
+            json.dumps({"kind": kind, "user_id": user_id, "movie": event["movie"], "rating": event["rating"],
+                        "at": event["at"].isoformat(), "attempts": event["attempts"], "error": str(error)},
+                       default=str) + "\n"
+            for (kind, user_id, _), event in events.items()
+        )
+        try:
+            with open(self.dead_letter_file, "a") as f:
+                f.write(lines)
+        except OSError as e:
+            # Last resort: the log is the only record left
+            logger.error("couldn't write %d events to %s (%s): %s", len(events), self.dead_letter_file, e, lines)
+            return
+        logger.error("wrote %d unwritten events to %s", len(events), self.dead_letter_file)
+
+# One queue per server process, shared by all sessions
+write_queue = WriteBehindQueue()
+atexit.register(write_queue.stop)
+
+def record_watched(user_id, movie):
+    """Record that a user viewed a movie without waiting for the database"""
+    if not WRITE_QUEUE_ENABLED:
+        return db.save_watched_movie(user_id, movie)
+
+    write_queue.put("watched", user_id, movie)
+    # The seen-set and replica stickiness live in session state, which the worker thread can't reach
+    db.mark_movie_seen(user_id, movie['id'])
+    db.note_session_write()
+    return True
+
+def record_rating(user_id, movie, rating):
+    """Record a user's rating without waiting for the database"""
+    if not WRITE_QUEUE_ENABLED:
+        return db.save_user_rating(user_id, movie, rating)
+
+    write_queue.put("rating", user_id, movie, rating)
+    db.mark_movie_seen(user_id, movie['id'])
+    db.note_session_write()
+    return True
+
+def flush_pending(user_id=None):
+    """Write queued events now, only the given user's if any, e.g. before showing their history"""
+    write_queue.flush(user_id)
+
+def replay_dead_letters(path=WRITE_QUEUE_DEAD_LETTER_FILE):
+    """
+    Write the events of a dead-letter file in one transaction
+
+    The file is moved aside while it is read, so events dead-lettered
+    meanwhile start a new one; if the write fails its events are appended
+    back. Watch events are logged as of now rather than their click time:
+    compaction may already have passed that time, and would never roll
+    them up.
+
+    Returns:
+    int: Events written, or None if the write failed
+    """
+    replaying = path + ".replaying"
+    try:
+        os.replace(path, replaying)
+    except FileNotFoundError:
+        return 0
+
+    with open(replaying) as f:
+        lines = [line for line in f if line.strip()]
+    events = [json.loads(line) for line in lines]
+    watched = [(event["user_id"], event["movie"]) for event in events if event["kind"] == "watched"]
+    ratings = [(event["user_id"], event["movie"], event["rating"])
+               for event in events if event["kind"] == "rating"]
+
+    saved = False
+    with db.transaction():
+        saved = db.save_watched_movies(watched) and db.save_user_ratings(ratings)
+    if not saved or db.get_last_transaction_error() is not None:
+        with open(path, "a") as f:
+            f.writelines(lines)
+        os.remove(replaying)
+        return None
+
+    os.remove(replaying)
+    return len(events)
+
+def get_write_queue_stats():
+    """Get the shared queue's depth and flush statistics"""
+    return write_queue.get_stats()